@@ -11,6 +11,7 @@ import matplotlib.lines as mlines
 import json
 import time
 import os
+from Distributed.initialization import setup_cache
 
 
 class Params:
@@ -34,7 +35,7 @@ class Params:
         # filename = 'MSOM-06-038-R2 Data Set in Excel Enhanced.xls'
         #filename = '/Users/juanest/Documents/PhD/Invierno23/Research/SupplyChainResilience/MBIA-SupplyChain/Distributed/initialization/CASE_instances.xlsx'
         # filename = 'Summer Case.xlsx'
-        data = pd.read_excel(filename, sheet_name='Agent', index_col=[0,1]).sort_index()
+        data = setup_cache.load_sheet(filename, 'Agent', index_col=[0, 1]).sort_index()
         stageCost = data['ProductionCost'].sort_index()
 
         self.info['depth'] = data['Level']
@@ -48,7 +49,7 @@ class Params:
         self.info['prodLine'] = data.index.tolist()
         # self.due_date = data.loc[pd.notna(data['avgDemand']), 'maxServiceTime']
 
-        self.link = pd.read_excel(filename, sheet_name='Link', index_col=[0, 1])
+        self.link = setup_cache.load_sheet(filename, 'Link', index_col=[0, 1])
         # self.E = self.link[['sourceStage', 'destinationStage']].to_records(index=False).tolist()
         self.E = set(self.link.index)
         self.e = {(v, k): stageCost.loc[v, k] for v, k in self.info['prodLine']}
@@ -56,7 +57,7 @@ class Params:
         self.u = {link: self.link.loc[link, 'TransportCapacity'] for link in self.E}
         self.Lmax = {v: data.loc[v, 'ProductionCapacity'].values[0] for v in self.V}
 
-        conversion = pd.read_excel(filename, sheet_name='ProductStructure', index_col=[1, 0])
+        conversion = setup_cache.load_sheet(filename, 'ProductStructure', index_col=[1, 0])
         self.r = {pair: conversion.loc[pair] for pair in conversion.index}
         self.info['conversion'] = conversion.reset_index()
 
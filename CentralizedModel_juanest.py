@@ -2,11 +2,15 @@ import numpy as np
 import gurobipy as gp
 from gurobipy import GRB
 from scipy import stats
+import scipy.sparse as sp
 from scipy.optimize import curve_fit
 import pandas as pd
 import networkx as nx
 import matplotlib.pyplot as plt
 from collections.abc import MutableMapping
+import time
+import json
+import os
 
 BIGGER_SIZE = 26
 plt.rc('font', size=BIGGER_SIZE)          # controls default text sizes
@@ -17,7 +21,8 @@ plt.rc('ytick', labelsize=BIGGER_SIZE-3)    # fontsize of the tick labels
 plt.rc('legend', fontsize=BIGGER_SIZE-5.5)    # legend fontsize
 plt.rc('figure', titlesize=BIGGER_SIZE)  # fontsize of the figure title
 
-def setup_model(params,time_neutral,ratios,unmet_penalty,relax):
+def setup_model_data(m,params,ratios,unmet_penalty):
+    #Sets, parameters and index structures of the model, stored as attributes of m
     def encode_params(param,override=[]):
         param_dict = {}
         for i in param:
@@ -41,7 +46,6 @@ def setup_model(params,time_neutral,ratios,unmet_penalty,relax):
                 items.append((new_key, v))
         return dict(items)
     
-    m = gp.Model('CentralizedModel_Gurobi')
     #Sets
     m._V = params['V'] #vertices
     m._K = params['K'] #product range
@@ -137,6 +141,25 @@ def setup_model(params,time_neutral,ratios,unmet_penalty,relax):
                 for kk in m._prod_stucture[k].keys():
                     m._valid_i_k.append((i,kk))
             m._valid_i_k.append((i,k))
+
+    #Adjacency indexes built once, so that each constraint family is generated in linear time
+    m._out_arcs = {} #(i,k) -> valid arcs leaving i with product k
+    m._in_arcs = {} #(i,k) -> valid arcs entering i with product k
+    m._link_arcs = {} #(i,j) -> valid arcs of link (i,j)
+    for i,j,k in m._valid_arcs:
+        m._out_arcs.setdefault((i,k),[]).append((i,j,k))
+        m._in_arcs.setdefault((j,k),[]).append((i,j,k))
+        m._link_arcs.setdefault((i,j),[]).append((i,j,k))
+    m._vertex_prods = {} #i -> products of i in _valid_i_k
+    for i,k in m._valid_i_k:
+        m._vertex_prods.setdefault(i,[]).append(k)
+    return m
+
+def setup_model(params,time_neutral,ratios,unmet_penalty,relax):
+    build_start = time.time()
+    m = gp.Model('CentralizedModel_Gurobi')
+    setup_model_data(m,params,ratios,unmet_penalty)
+
     ## variables
 
     #network flow
@@ -210,14 +233,15 @@ def setup_model(params,time_neutral,ratios,unmet_penalty,relax):
                             ,GRB.MINIMIZE)
 
     #Constraints
-    m.addConstrs(((gp.quicksum(m._y[i,j,k] for _,j,kk in m._valid_arcs if _ == i if kk == k) - gp.quicksum(m._y[j,i,k] for j,_,kk in m._valid_arcs if _ == i if kk == k) 
-                    + gp.quicksum( m._r[k1,k]*m._p_cap[i,k1]*m._p[i,k1] for _,k1 in m._valid_i_k if _ == i) - m._p_cap[i,k]*m._p[i,k] 
+    m.addConstrs(((gp.quicksum(m._y[arc] for arc in m._out_arcs.get((i,k),[])) - gp.quicksum(m._y[arc] for arc in m._in_arcs.get((i,k),[])) 
+                    + gp.quicksum( m._r[k1,k]*m._p_cap[i,k1]*m._p[i,k1] for k1 in m._vertex_prods[i]) - m._p_cap[i,k]*m._p[i,k] 
                     == 
                     m._x[i,k] + m._I_0[i,k]-m._I[i,k]) for i,k in m._valid_i_k)
                     ,'Flow balance constraints')
     m.addConstrs((m._y[i,j,k] <= m._q_ind[i,j,k]*m._beta[i,j,k] for i,j,k in m._valid_arcs),name='Link_product_capacity')
-    m.addConstrs((gp.quicksum(m._y[i,j,k] for _,__,k in m._valid_arcs if _ == i if __ == j) <= m._q_mix[i,j] for i,j,_ in m._valid_arcs),name='Link_capacity')
-    m.addConstrs((gp.quicksum(m._p[i,k] for _,k in m._valid_i_k if _ == i) <= m._p_bar[i]*m._zeta[i] for i,_ in m._valid_i_k),name='production capacity')
+    #one capacity constraint per link and per vertex
+    m.addConstrs((gp.quicksum(m._y[arc] for arc in m._link_arcs[i,j]) <= m._q_mix[i,j] for i,j in m._link_arcs),name='Link_capacity')
+    m.addConstrs((gp.quicksum(m._p[i,k] for k in m._vertex_prods[i]) <= m._p_bar[i]*m._zeta[i] for i in m._vertex_prods),name='production capacity')
     m.addConstrs((m._delta_d[i,k] >= m._x[i,k] - m._d[i,k] for i,k in m._valid_i_k),name='Demand penalty')
     m.addConstrs((m._delta_I[i,k] >= m._I_s[i,k] - m._I[i,k] for i,k in m._valid_i_k),name='Inventory penalty')
     #m.addConstrs((m._x[i,k] >= m._d[i,k] for i in m._V for k in m._K),name='Demand constraints')
@@ -267,14 +291,197 @@ def setup_model(params,time_neutral,ratios,unmet_penalty,relax):
         m.addConstrs((m._m_z[i,j,k] >= m._a[i,j,k] - ((1-m._z[i,j,k])*m._bigM) for i,j,k in m._valid_arcs),name='a_z_linear3')
         m.addConstrs((m._w[i,j,k] == m._LatePenaltyInitial*m._z[i,j,k] + m._LatePenaltySlope*m._m_z[i,j,k] - m._LatePenaltySlope*m._z[i,j,k]*m._t[j,k] for i,j,k in m._valid_arcs),name='a_z_linear4')
     '''
+    #Model size, to track it across network versions
+    m.update()
+    m._build_stats = {'rows':m.NumConstrs,'cols':m.NumVars,'nonzeros':m.NumNZs,'build_seconds':time.time()-build_start}
+    return m
+
+def setup_model_matrix(params,time_neutral,ratios,unmet_penalty,relax):
+    #Same model as setup_model, built from sparse matrices with the matrix API
+    #The variables are wrapped in tupledicts with the same keys, so the rest of the code works with either builder
+    build_start = time.time()
+    m = gp.Model('CentralizedModel_Gurobi')
+    setup_model_data(m,params,ratios,unmet_penalty)
+
+    def vector(param,keys):
+        return np.array([param[key] for key in keys],dtype=float)
+
+    def sparse(entries,shape):
+        #entries: (row, column, value), repeated entries are summed
+        if len(entries) == 0:
+            return sp.csr_matrix(shape)
+        rows,cols,vals = zip(*entries)
+        return sp.csr_matrix((vals,(rows,cols)),shape=shape)
+
+    arcs = m._valid_arcs
+    i_k = list(dict.fromkeys(m._valid_i_k))
+    links = list(m._link_arcs.keys())
+    vertices = list(m._vertex_prods.keys())
+    arc_idx = {arc:col for col,arc in enumerate(arcs)}
+    ik_idx = {ik:col for col,ik in enumerate(i_k)}
+    v_idx = {v:col for col,v in enumerate(m._V)}
+    n_a,n_ik,n_v = len(arcs),len(i_k),len(m._V)
+
+    ## variables
+    if relax == True:
+        usage = {'lb':0,'ub':1}
+    else:
+        usage = {'vtype':GRB.BINARY}
+    y = m.addMVar(n_a, name='flow')
+    beta = m.addMVar(n_a, name='link_product_usage', **usage)
+    zeta = m.addMVar(n_v, name='prodLine_usage', **usage)
+    z = m.addMVar(n_a, name='duedate_exceeded', **usage)
+    x = m.addMVar(n_ik, name='demand_satisfied',lb=-GRB.INFINITY,ub=GRB.INFINITY)
+    p = m.addMVar(n_ik, name='run_length')
+    I = m.addMVar(n_ik, name='inventory')
+    delta_d = m.addMVar(n_ik, name='penalty_demand')
+    delta_I = m.addMVar(n_ik, name='penalty_inv')
+
+    #Objective function
+    obj = (vector(m._c,arcs) @ y + vector(m._h,i_k) @ I + vector(m._e,i_k) @ p + vector(m._f,arcs) @ beta +
+           vector(m._phi,m._V) @ zeta + vector(m._rho_I,i_k) @ delta_I + vector(m._rho_d,i_k) @ delta_d)
+    if time_neutral == False:
+        ##Lead time variables
+        a = m.addMVar(n_a, name='arrival_time')
+        o = m.addMVar(n_ik, name='initial_proc_time')
+        m_z = m.addMVar(n_a, name='product_z_a')
+        m_beta = m.addMVar(n_a, name='product_beta_o')
+        w = m.addMVar(n_a, name='total penalty computed')
+        obj = obj + np.ones(n_a) @ w
+    m.setObjective(obj,GRB.MINIMIZE)
+
+    #Constraints
+    #flow balance: outflow - inflow + used as material - produced - x + I == I_0
+    A_y = sparse([(row,arc_idx[arc],1) for row,ik in enumerate(i_k) for arc in m._out_arcs.get(ik,[])] +
+                 [(row,arc_idx[arc],-1) for row,ik in enumerate(i_k) for arc in m._in_arcs.get(ik,[])],(n_ik,n_a))
+    A_p = sparse([(row,ik_idx[i,k1],m._r[k1,k]*m._p_cap[i,k1]) for row,(i,k) in enumerate(i_k) for k1 in m._vertex_prods[i]] +
+                 [(row,row,-m._p_cap[i,k]) for row,(i,k) in enumerate(i_k)],(n_ik,n_ik))
+    m.addConstr(A_y @ y + A_p @ p - x + I == vector(m._I_0,i_k),name='Flow balance constraints')
+    m.addConstr(y - sp.diags(vector(m._q_ind,arcs)) @ beta <= 0,name='Link_product_capacity')
+    #one capacity constraint per link and per vertex
+    A_link = sparse([(row,arc_idx[arc],1) for row,link in enumerate(links) for arc in m._link_arcs[link]],(len(links),n_a))
+    m.addConstr(A_link @ y <= vector(m._q_mix,links),name='Link_capacity')
+    A_prod = sparse([(row,ik_idx[i,k],1) for row,i in enumerate(vertices) for k in m._vertex_prods[i]],(len(vertices),n_ik))
+    A_zeta = sparse([(row,v_idx[i],m._p_bar[i]) for row,i in enumerate(vertices)],(len(vertices),n_v))
+    m.addConstr(A_prod @ p - A_zeta @ zeta <= 0,name='production capacity')
+    m.addConstr(delta_d - x >= -vector(m._d,i_k),name='Demand penalty')
+    m.addConstr(delta_I + I >= vector(m._I_s,i_k),name='Inventory penalty')
+
+    #tupledicts with the same keys as setup_model
+    m._y = gp.tupledict(zip(arcs,y.tolist()))
+    m._beta = gp.tupledict(zip(arcs,beta.tolist()))
+    m._zeta = gp.tupledict(zip(m._V,zeta.tolist()))
+    m._z = gp.tupledict(zip(arcs,z.tolist()))
+    m._x = gp.tupledict(zip(i_k,x.tolist()))
+    m._p = gp.tupledict(zip(i_k,p.tolist()))
+    m._I = gp.tupledict(zip(i_k,I.tolist()))
+    m._delta_d = gp.tupledict(zip(i_k,delta_d.tolist()))
+    m._delta_I = gp.tupledict(zip(i_k,delta_I.tolist()))
+    if time_neutral == False:
+        m._a = gp.tupledict(zip(arcs,a.tolist()))
+        m._o = gp.tupledict(zip(i_k,o.tolist()))
+        m._m_z = gp.tupledict(zip(arcs,m_z.tolist()))
+        m._m_beta = gp.tupledict(zip(arcs,m_beta.tolist()))
+        m._w = gp.tupledict(zip(arcs,w.tolist()))
+
+    m.update()
+    m._build_stats = {'rows':m.NumConstrs,'cols':m.NumVars,'nonzeros':m.NumNZs,'build_seconds':time.time()-build_start}
     return m
 
+class LatenessAggregator:
+    #Online statistics of the simulation results, fed chunk by chunk by generate_stochastic_leadtime
+    #Keeps the flow per (lateness,k) histograms used by condensed_statistics_single and the moments of the total
+    #penalty per sample (Welford/Chan update), instead of all the simulated rows
+    def __init__(self,V_type):
+        self.V_type = V_type
+        self.hist = {}
+        self.retail_hist = {}
+        self.n_samples = 0
+        self.penalty_mean = 0.0
+        self.penalty_m2 = 0.0
+        self.penalty_min = np.inf
+        self.penalty_max = -np.inf
+
+    def add(self,results):
+        #results: simulation results of complete samples, columns as df_sim_res
+        retail = results['j'].map(self.V_type) == 'Retail'
+        for hist,rows in [(self.hist,results),(self.retail_hist,results[retail])]:
+            for key,flow in rows.groupby(['lateness','k'])['flow'].sum().items():
+                hist[key] = hist.get(key,0) + flow
+
+        penalty = results.groupby('id')['Total Penalty'].sum().to_numpy(dtype=float)
+        if len(penalty) == 0:
+            return
+        n = self.n_samples + len(penalty)
+        delta = penalty.mean() - self.penalty_mean
+        self.penalty_m2 += ((penalty-penalty.mean())**2).sum() + delta**2*self.n_samples*len(penalty)/n
+        self.penalty_mean += delta*len(penalty)/n
+        self.n_samples = n
+        self.penalty_min = min(self.penalty_min,penalty.min())
+        self.penalty_max = max(self.penalty_max,penalty.max())
+
+    def histogram(self,retail=False):
+        #Flow per lateness (rows) and product (columns), same frame as the groupby in condensed_statistics_single
+        hist = self.retail_hist if retail else self.hist
+        hist = pd.Series(list(hist.values()),index=pd.MultiIndex.from_tuples(list(hist.keys()),names=['lateness','k']),dtype=float)
+        return hist.sort_index().to_frame('flow').unstack().fillna(0)
+
+    def penalty_moments(self):
+        #Mean, variance, min and max of the total penalty of a sample
+        var = self.penalty_m2/(self.n_samples-1) if self.n_samples > 1 else 0.0
+        return {'n_samples':self.n_samples,'mean':self.penalty_mean,'var':var,'min':self.penalty_min,'max':self.penalty_max}
+
+    def __repr__(self):
+        return 'LatenessAggregator(%s)' % self.penalty_moments()
+
+
+class ParquetResults:
+    #Writes the simulation results chunk by chunk to a Parquet file (one row group per chunk), requires pyarrow
+    #The file is only complete once closed (last row group and footer), generate_stochastic_leadtime closes its sinks,
+    #otherwise use it as a context manager: with ParquetResults(path) as sink: ...
+    #The file can be read back with pd.read_parquet or as a pyarrow dataset
+    def __init__(self,path):
+        import pyarrow
+        import pyarrow.parquet
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = path
+        self.writer = None
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.close()
+
+    def add(self,results):
+        if self.closed:
+            #a new writer would overwrite the closed file
+            raise ValueError('%s is already closed' % self.path)
+        table = self.pa.Table.from_pandas(results,preserve_index=False)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path,table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        self.closed = True
+
+
 class CentralizedSinglePeriod:
-    def __init__(self, params,time_neutral=False,ratios=[],unmet_penalty=[],relax=False):
+    def __init__(self, params,time_neutral=False,ratios=[],unmet_penalty=[],relax=False,backend='tupledict'):
+        #backend: 'tupledict' builds the model row by row, 'matrix' builds it from sparse matrices
         self.time_neutral = time_neutral
         self.results = None
         self.solved = False
-        self.m = setup_model(params,time_neutral,ratios,unmet_penalty,relax)
+        if backend == 'matrix':
+            self.m = setup_model_matrix(params,time_neutral,ratios,unmet_penalty,relax)
+        else:
+            self.m = setup_model(params,time_neutral,ratios,unmet_penalty,relax)
+        self.build_stats = self.m._build_stats
         #Setting colormap for style
         self.color_map = {'Vehicle1':'tab:red','Dashboard':'brown','Vehicle2':'tab:blue','PowerTrain1':'orange','Transmission':'tab:green','PowerTrain2':'black'}
     
@@ -330,10 +537,138 @@ class CentralizedSinglePeriod:
             network['penalty_zeta'][idx] = penalties['v']
         return network
 
+    #Solution attributes set by solve
+    solution_attrs = ['y_sol','beta_sol','x_sol','p_sol','zeta_sol','I_sol','delta_d_sol','delta_I_sol',
+                      'm_beta_sol','a_sol','o_sol','z_sol']
+
+    def apply_disruption(self,vertices=[],links=[]):
+        #Removes the lost vertices and links from the base model by bounding their usage and flow variables to zero
+        #The baseline solution (if solved) is set as MIP start, revert_disruption restores the base model
+        self.m.update()
+        lost_vertices,lost_arcs,disabled = self._lost_vars(vertices,links)
+        self._disabled_vars = disabled
+        self._disabled_ub = self.m.getAttr('UB',disabled)
+        self.m.setAttr('UB',disabled,[0]*len(disabled))
+
+        if hasattr(self,'y_sol'):
+            lost_arcs = set(lost_arcs)
+            for var_dict,sol in [(self.m._y,self.y_sol),(self.m._beta,self.beta_sol)]:
+                keys = list(var_dict.keys())
+                self.m.setAttr('Start',[var_dict[key] for key in keys],[0 if key in lost_arcs else sol[key] for key in keys])
+            keys = list(self.m._zeta.keys())
+            self.m.setAttr('Start',[self.m._zeta[key] for key in keys],[0 if key in lost_vertices else self.zeta_sol[key] for key in keys])
+
+    def _lost_vars(self,vertices,links):
+        #Lost vertices, lost valid arcs and the variables that have to be zero without them
+        lost_vertices = set(vertices)
+        lost_links = set(tuple(l) for l in links)
+        lost_arcs = [arc for arc in self.m._valid_arcs
+                     if arc[0] in lost_vertices or arc[1] in lost_vertices or arc[:2] in lost_links]
+        disabled = [self.m._zeta[i] for i in lost_vertices if i in self.m._zeta]
+        disabled += [self.m._y[arc] for arc in lost_arcs] + [self.m._beta[arc] for arc in lost_arcs]
+        return lost_vertices,lost_arcs,disabled
+
+    def revert_disruption(self):
+        #Restores the bounds changed by apply_disruption and clears the MIP start
+        self.m.setAttr('UB',self._disabled_vars,self._disabled_ub)
+        for var_dict in [self.m._y,self.m._beta,self.m._zeta]:
+            self.m.setAttr('Start',list(var_dict.values()),[GRB.UNDEFINED]*len(var_dict))
+        self._disabled_vars = []
+        self._disabled_ub = []
+
+    def solve_disruption(self,vertices=[],links=[],silent=True):
+        #Re-optimizes the base model without the lost vertices and links, warm started from the baseline solution
+        #Returns the plan in the schema of CentralizedResults/<case>.json, None if no optimal plan is found
+        #The base model and the baseline solution are kept, so the next disruption starts from them again
+        baseline = {name:getattr(self,name) for name in self.solution_attrs if hasattr(self,name)}
+        baseline_results = self.results
+        self.apply_disruption(vertices,links)
+        try:
+            self.solve(silent=silent)
+            self.disruption_runtime = self.m.Runtime
+            if self.m.Status == GRB.OPTIMAL:
+                results = self._plan_results()
+            else:
+                results = None
+        finally:
+            self.revert_disruption()
+            for name,value in baseline.items():
+                setattr(self,name,value)
+            self.results = baseline_results
+        return results
+
+    def solve_scenarios(self,disruptions,result_dir=None,silent=True):
+        #Solves all the disruptions together as scenarios of one multi-scenario model
+        #disruptions: {case_name: {'vertices': [...], 'links': [...]}}, each case is a scenario where the variables
+        #of the lost vertices and links are bounded to zero
+        #Returns {case_name: plan} in the schema of CentralizedResults/<case>.json (None if the scenario has no solution)
+        #and writes <result_dir>/<case_name>.json for each case if result_dir is given
+        cases = list(disruptions.keys())
+        self.m.Params.LogToConsole = 0 if silent else 1
+        self.m.NumScenarios = len(cases)
+        for n,case in enumerate(cases):
+            self.m.Params.ScenarioNumber = n
+            self.m.update()
+            _,_,disabled = self._lost_vars(disruptions[case].get('vertices',[]),disruptions[case].get('links',[]))
+            self.m.setAttr('ScenNUB',disabled,[0]*len(disabled))
+        try:
+            self.m.optimize()
+            self.scenarios_runtime = self.m.Runtime
+            results = {}
+            for n,case in enumerate(cases):
+                self.m.Params.ScenarioNumber = n
+                if self.m.SolCount == 0 or self.m.ScenNObjVal >= GRB.INFINITY:
+                    results[case] = None
+                    continue
+                solution = {}
+                for name,var_dict in [('y_sol',self.m._y),('beta_sol',self.m._beta),('zeta_sol',self.m._zeta),('p_sol',self.m._p)]:
+                    keys = list(var_dict.keys())
+                    solution[name] = dict(zip(keys,self.m.getAttr('ScenNX',[var_dict[key] for key in keys])))
+                results[case] = self._plan_results(solution)
+        finally:
+            #back to the single-scenario base model
+            self.m.NumScenarios = 0
+            self.m.update()
+
+        if result_dir is not None:
+            for case,plan in results.items():
+                if plan is not None:
+                    with open(os.path.join(result_dir,'%s.json' % case),'w',encoding='utf-8') as f:
+                        json.dump(plan,f,ensure_ascii=False,indent=4)
+        return results
+
+    def _plan_results(self,solution=None):
+        #Solution as production and flow plan, same schema as CentralizedResults/<case>.json
+        #solution: {'y_sol','beta_sol','zeta_sol','p_sol'} of a scenario, the current solution if not given
+        if solution is None:
+            solution = {name:getattr(self,name) for name in ['y_sol','beta_sol','zeta_sol','p_sol']}
+        y_sol,beta_sol,zeta_sol,p_sol = solution['y_sol'],solution['beta_sol'],solution['zeta_sol'],solution['p_sol']
+        valid_i_k = list(dict.fromkeys(self.m._valid_i_k))
+        prodCost = 0
+        for i in self.m._V:
+            prodCost += self.m._phi[i]*zeta_sol[i]
+        for i,k in valid_i_k:
+            prodCost += self.m._e[i,k]*p_sol[i,k]
+        transCost = 0
+        for i,j,k in self.m._valid_arcs:
+            transCost += self.m._f[i,j,k]*beta_sol[i,j,k]
+            transCost += self.m._c[i,j,k]*y_sol[i,j,k]
+        production = []
+        for i,k in valid_i_k:
+            if abs(p_sol[i,k]) > 1e-8:
+                production.append({'Agent': i, "Product": k, "Value": float(p_sol[i,k])})
+        flows = []
+        for i,j,k in self.m._valid_arcs:
+            if abs(y_sol[i,j,k]) > 1e-8:
+                flows.append({'Source': i, "Dest": j, "Product": k, "Value": float(y_sol[i,j,k])})
+        return {'Production cost': float(prodCost), 'Flow cost': float(transCost), 'Productions': production, 'Flows': flows}
+
     def solve(self,disruption_response=False,silent=False):
         self.results = {}
         if silent == False:
             self.m.Params.LogToConsole = 1
+            print('Model built in %.3f s: %d rows, %d columns, %d nonzeros' % (self.build_stats['build_seconds'],
+                  self.build_stats['rows'],self.build_stats['cols'],self.build_stats['nonzeros']))
         else:
             self.m.Params.LogToConsole = 0
         sc = gp.StatusConstClass
@@ -768,10 +1103,17 @@ class CentralizedSinglePeriod:
     
     def condensed_statistics_single(self,stats):
         #plotting histogram of lateness of products
-        stats = pd.concat(stats, ignore_index=True)
-        stats['Type'] = stats['j'].map(self.m._V_type)
-        print(stats)
-        hist_data = stats[stats['Type']=='Retail'][['lateness','flow','k']].groupby(['lateness','k']).sum().unstack().fillna(0)
+        #stats: list of simulation results (df_sim_res) or a LatenessAggregator filled by generate_stochastic_leadtime
+        if isinstance(stats,LatenessAggregator):
+            print(stats)
+            hist_data = stats.histogram(retail=True)
+            all_hist_data = stats.histogram()
+        else:
+            stats = pd.concat(stats, ignore_index=True)
+            stats['Type'] = stats['j'].map(self.m._V_type)
+            print(stats)
+            hist_data = stats[stats['Type']=='Retail'][['lateness','flow','k']].groupby(['lateness','k']).sum().unstack().fillna(0)
+            all_hist_data = stats[['lateness','flow','k']].groupby(['lateness','k']).sum().unstack().fillna(0)
         for c in hist_data.columns:
             col = hist_data[c]
             sum = col.sum()
@@ -808,7 +1150,7 @@ class CentralizedSinglePeriod:
         plt.savefig('baseline_solution_simulation.pdf',bbox_inches='tight')
         plt.show()
 
-        hist_data = stats[['lateness','flow','k']].groupby(['lateness','k']).sum().unstack().fillna(0)
+        hist_data = all_hist_data
         for c in hist_data.columns:
             col = hist_data[c]
             sum = col.sum()
@@ -850,9 +1192,15 @@ class CentralizedSinglePeriod:
         plt.bar(xData, yData) # plot the raw data as bar chart
         plt.plot(xData, y_fit) # plot the equation using the fitted parameters
         '''
-        stats = pd.concat(simulations, ignore_index=True)
-        stats['Type'] = stats['j'].map(self.m._V_type)
-        hist_data = stats[stats['Type']=='Retail']
+        #simulations: list of simulation results (df_sim_res) with a 'scenario' column,
+        #or {scenario: LatenessAggregator} filled by generate_stochastic_leadtime
+        if isinstance(simulations,dict):
+            hist_data = pd.concat({scenario:stats.histogram(retail=True)['flow'].stack() for scenario,stats in simulations.items()},
+                                  names=['scenario']).rename('flow').reset_index()
+        else:
+            stats = pd.concat(simulations, ignore_index=True)
+            stats['Type'] = stats['j'].map(self.m._V_type)
+            hist_data = stats[stats['Type']=='Retail']
         #colors = [colors1,colors2]
 
         ks = hist_data['k'].unique()
@@ -916,8 +1264,36 @@ class CentralizedSinglePeriod:
 
         return k_data
 
-    def generate_stochastic_leadtime(self,n_samples,disrupted_agents={}):
-        
+    def generate_stochastic_leadtime(self,n_samples,disrupted_agents={},chunk_size=None,sinks=[]):
+        #Without chunk_size all the samples are kept in memory and returned as (self.df_sim_res,self.scenarios)
+        #With chunk_size the samples are drawn and simulated chunk_size at a time and each chunk of results is passed
+        #to the sinks (LatenessAggregator, ParquetResults), so the memory does not grow with n_samples
+        #The sinks with a close method (ParquetResults) are closed at the end, also when the simulation fails
+        if chunk_size is not None:
+            try:
+                topology = self.flow_topology()
+                for start in range(0,n_samples,chunk_size):
+                    scenarios = self.sample_scenarios(min(chunk_size,n_samples-start),disrupted_agents)
+                    scenarios.columns = range(start,start+len(scenarios.columns))
+                    results = self.batch_results(self.simulate_flows_batch(scenarios,topology),ids=list(scenarios.columns))
+                    for sink in sinks:
+                        sink.add(results)
+            finally:
+                for sink in sinks:
+                    if hasattr(sink,'close'):
+                        sink.close()
+            return sinks
+
+        self.scenarios = self.sample_scenarios(n_samples,disrupted_agents)
+
+        #All the scenarios are simulated at once, same columns as concatenating simulate_flows of each scenario
+        self.sim_batch = self.simulate_flows_batch(self.scenarios)
+        self.df_sim_res = self.batch_results(self.sim_batch,ids=list(self.scenarios.columns))
+
+        return self.df_sim_res,self.scenarios
+
+    def sample_scenarios(self,n_samples,disrupted_agents={}):
+        #Lead times of n_samples scenarios, indexed by (i,j,k) with one column per sample
         disrupted_agents_list = list(disrupted_agents.keys())
         #key_mapper = {'i':0,'j':1,'k':2}
 
@@ -947,14 +1323,7 @@ class CentralizedSinglePeriod:
                 samples.fill(mean)
                 sampled_scenarios.append(samples)     
 
-        self.scenarios = pd.DataFrame(sampled_scenarios,index=sampled_scenarios_idx)
-
-        simulated_results = []
-        for s in self.scenarios:
-            simulated_results.append(self.simulate_flows(self.scenarios[s],id=s))
-        self.df_sim_res = pd.concat(simulated_results)
-
-        return self.df_sim_res,self.scenarios
+        return pd.DataFrame(sampled_scenarios,index=sampled_scenarios_idx)
         
     
     def sample_gaussian_trunc(self,lc,uc,mean,sd,n_samples):
@@ -1162,6 +1531,109 @@ class CentralizedSinglePeriod:
         if id != None:
             arrival_times['id'] = id
         return arrival_times
+
+    def flow_topology(self):
+        #Active flows of the solution and the order in which simulate_flows computes their arrival times
+        #Returns the arcs (sorted), {arc: position} and the steps [(arc updates, start time updates)] of the vertices
+        #arc update: (arc position, (i,k)) -> a[arc] = lead time + o[i,k]
+        #start time update: ((j,k), arc positions) -> o[j,k] = max of a over the arcs
+        arcs = sorted(key for key,val in self.y_sol.items() if val > 0)
+        arc_pos = {arc:n for n,arc in enumerate(arcs)}
+        in_flows = {}
+        for i,j,k in arcs:
+            in_flows.setdefault(j,[]).append((i,j,k))
+
+        tier_members = {tier:[] for tier in ['Part','Manuf','Dist','Retail']}
+        for v,type in self.m._V_type.items():
+            tier_members[type].append(v)
+        steps = []
+        for tier in ['Manuf','Dist','Retail']:
+            for j in tier_members[tier]:
+                if j not in in_flows:
+                    continue
+                arc_updates = [(arc_pos[arc],(arc[0],arc[2])) for arc in in_flows[j]]
+                start_updates = []
+                for k in self.m._active_prods[j]:
+                    if tier == 'Manuf':
+                        #starts when the last of the sub products arrives, if all of them are received
+                        sub_prods = self.m._prod_conv[self.m._prod_conv['downstream']==k]['upstream'].values
+                        group = [arc_pos[arc] for arc in in_flows[j] if arc[2] in sub_prods]
+                        if set(sub_prods).issubset(arc[2] for arc in in_flows[j]):
+                            start_updates.append(((j,k),group))
+                    else:
+                        group = [arc_pos[arc] for arc in in_flows[j] if arc[2] == k]
+                        if len(group) > 0:
+                            start_updates.append(((j,k),group))
+                steps.append((arc_updates,start_updates))
+        return arcs,arc_pos,steps
+
+    def simulate_flows_batch(self,scenarios,topology=None):
+        #Same simulation as simulate_flows for all the scenarios at once
+        #scenarios: lead times indexed by (i,j,k) with one column per sample, as self.scenarios
+        #The arrival times a and start times o are arrays over the samples, the topology is computed once
+        #(or given, from flow_topology)
+        #Returns the arcs and the arrays of shape (n_samples, n_arcs) of arrival time, lateness and penalty
+        if topology is None:
+            topology = self.flow_topology()
+        arcs,arc_pos,steps = topology
+        lead_times = scenarios.loc[arcs].to_numpy(dtype=float).T
+        a = lead_times.copy()
+        o = {}
+        for part in self.m._V_type:
+            if self.m._V_type[part] == 'Part':
+                for k in self.m._active_prods[part]:
+                    o[(part,k)] = 0
+        for arc_updates,start_updates in steps:
+            for n,(i,k) in arc_updates:
+                a[:,n] = lead_times[:,n] + o[(i,k)]
+            for key,group in start_updates:
+                o[key] = a[:,group].max(axis=1)
+
+        flow = np.array([self.y_sol[arc] for arc in arcs],dtype=float)
+        due_date = np.array([self.m._t[(j,k)] for i,j,k in arcs],dtype=float)
+        lateness = np.maximum(a-due_date,0)
+        fixed_penalty = np.where(lateness > 1e-10,flow*self.m._LatePenaltyInitial,0)
+        lateness = np.ceil(lateness).astype(int)
+        linear_penalty = (lateness*flow*self.m._LatePenaltySlope).astype(int)
+        #As in simulate_flows the fixed penalty is not truncated, the total is integer unless a fixed penalty is fractional
+        total_penalty = fixed_penalty+linear_penalty
+        if np.array_equal(total_penalty,np.round(total_penalty)):
+            total_penalty = total_penalty.astype(int)
+        return {'arcs':arcs,
+                'flow':flow,
+                'due_date':due_date,
+                'Link utilization':np.round(flow/np.array([self.m._q_ind[arc] for arc in arcs],dtype=float),2),
+                'Vertex utilization':np.round(flow/np.array([self.m._p_bar[i] for i,j,k in arcs],dtype=float),2),
+                'time':a,
+                'lateness':lateness,
+                'Total Penalty':total_penalty}
+
+    def batch_results(self,sim,ids=None):
+        #Long table of simulate_flows_batch, same rows and columns as concatenating simulate_flows of each sample
+        #Only the arcs with flow above 1e-10 are reported, as in simulate_flows
+        keep = np.flatnonzero(sim['flow'] > 1e-10)
+        arcs = [sim['arcs'][n] for n in keep]
+        n_samples,n_arcs = sim['time'].shape[0],len(keep)
+        if ids is None:
+            ids = range(n_samples)
+        i,j,k = (np.array([arc[pos] for arc in arcs],dtype=object) for pos in range(3))
+        time = sim['time'][:,keep].ravel()
+        #per sample sorted by time and (i,j), ties kept in the order of k
+        ij_rank = {ij:r for r,ij in enumerate(sorted(set(arc[:2] for arc in arcs)))}
+        ij_rank = np.tile([ij_rank[arc[:2]] for arc in arcs],n_samples)
+        sample = np.repeat(np.arange(n_samples),n_arcs)
+        order = np.lexsort((ij_rank,time,sample))
+        results = pd.DataFrame({'i':np.tile(i,n_samples),
+                                'j':np.tile(j,n_samples),
+                                'k':np.tile(k,n_samples),
+                                'time':time,
+                                'flow':np.tile(sim['flow'][keep],n_samples),
+                                'lateness':sim['lateness'][:,keep].ravel(),
+                                'Link utilization':np.tile(sim['Link utilization'][keep],n_samples),
+                                'Vertex utilization':np.tile(sim['Vertex utilization'][keep],n_samples),
+                                'Total Penalty':sim['Total Penalty'][:,keep].ravel(),
+                                'id':np.repeat(np.asarray(ids),n_arcs)})
+        return results.iloc[order].reset_index(drop=True)
     
 
 
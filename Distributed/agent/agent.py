@@ -10,7 +10,13 @@
 # Super class for agents in the supply chain network
 from Distributed.initialization import network
 from Distributed.knowledgebase import capability_model, environment_model, state_model, communication_manager
+from Distributed.knowledgebase import optimization_manager
 from termcolor import colored
+import math
+import time
+from collections import deque
+import numpy as np
+import scipy.sparse as sp
 import gurobipy as gp
 from gurobipy import GRB
 
@@ -26,9 +32,18 @@ class Agent:
         self.environment = environment_model.EnvironmentModel()
         self.state = state_model.StateModel()
         self.communication_manager = communication_manager.CommunicationManager()
+        self.optimization_manager = optimization_manager.OptimizationManager()
         self.down = False
         self.demand = dict()
 
+    # record the disruption or the demand of the agent in the changed agents of the snapshot and in the journal of
+    # the network before it changes
+    def record_change(self, attr):
+        if self.state.changed_agents is not None:
+            self.state.changed_agents.add(self.name)
+        if self.state.journal is not None:
+            self.state.journal.record_attr(self.name, self, attr)
+
     # disrupted agent identifies demand agents and their demands
     def find_demand_agents(self, agent_network, lost_production, lost_flow):
         # find demand agents
@@ -39,6 +54,7 @@ class Agent:
                 if ag not in demand_agents:
                     demand_agents.append(ag)
                 # identify demand
+                ag.record_change("demand")
                 ag.demand[f[0][2]] = f[1]
         # for ag in demand_agents:
         #     for d in ag.demand.keys():
@@ -57,25 +73,25 @@ class Agent:
         return supplier_agents
 
     # demand agent sends request to supplier agents
+    # one request to each supplier agent with all the products requested from it
     def send_request(self, supplier_agents):
+        requests = {}
         for product in supplier_agents.keys():
             # req = {product: self.demand[product]}
             for sup_ag in supplier_agents[product]:
-                # Store the request information
-                try:
-                    self.communication_manager.delivered_request[sup_ag.name].update({product: self.demand[product]})
-                    sup_ag.communication_manager.received_request[self.name].update({product: self.demand[product]})
-                except:
-                    self.communication_manager.delivered_request[sup_ag.name] = {product: self.demand[product],
-                                                                                 "reqToAgent": sup_ag}
-                    sup_ag.communication_manager.received_request[self.name] = {product: self.demand[product],
-                                                                                "reqFromAgent": self}
-
-                    # supplier agent determines its response to request
+                if sup_ag.name not in requests:
+                    requests[sup_ag.name] = communication_manager.Request(self, sup_ag, {})
+                requests[sup_ag.name].quantities[product] = self.demand[product]
+        for request in requests.values():
+            self.communication_manager.send(request)
 
     # supplier agent determine response
-    def response_optimizer(self, transportation):
-        demand_agents = self.communication_manager.received_request.keys()
+    # solver: "gurobi" solves the MILP, "greedy" fills the requests in closed form without the solver
+    def response_optimizer(self, transportation, solver="gurobi"):
+        requests = {}
+        for request in self.communication_manager.received_requests():
+            requests[request.sender.name] = request
+        demand_agents = requests.keys()
         product_set = {}
         demands = {}
         flow_limit = {}
@@ -83,13 +99,12 @@ class Agent:
 
         # Computes the flow limit and production limit
         for ag_name in demand_agents:
-            for product in self.communication_manager.received_request[ag_name].keys():
-                if product != "reqFromAgent":
-                    try:
-                        product_set[ag_name].append(product)
-                    except:
-                        product_set[ag_name] = [product]
-                    demands[(ag_name, product)] = self.communication_manager.received_request[ag_name][product]
+            for product in requests[ag_name].quantities.keys():
+                try:
+                    product_set[ag_name].append(product)
+                except:
+                    product_set[ag_name] = [product]
+                demands[(ag_name, product)] = requests[ag_name].quantities[product]
 
             flow_limit[ag_name] = transportation.get_available_capacity(self.name, ag_name, overcapacity_multiplier)
 
@@ -98,24 +113,21 @@ class Agent:
             current_production += self.state.production[key]
         production_limit = self.capability.get_capacity() * overcapacity_multiplier - current_production
 
-        # MILP gurobi model
-        model = gp.Model('response_optimizer')
-        model.Params.LogToConsole = 0
         pairs = [(j, k) for j in demand_agents for k in product_set[j]]
-        y = model.addVars(pairs, vtype=GRB.INTEGER, name="max_flow")
-
-        obj = model.setObjective(gp.quicksum(demands[j, k] - y[j, k]
-                                             for j in demand_agents for k in product_set[j]), GRB.MINIMIZE)
-
-        tp_constrs = model.addConstrs((gp.quicksum(y[j, k] for k in product_set[j]) <= flow_limit[j]
-                                       for j in demand_agents), name="tp_limit")
-        pd_constrs = model.addConstr(gp.quicksum(y[j, k] for j in demand_agents for k in product_set[j])
-                                      <= production_limit, name="pd_limit")
-        demand_constrs = model.addConstrs((y[j, k] <= demands[j, k] for j in demand_agents for k in product_set[j]),
-                                          name="demand_limit")
+        start_time = time.perf_counter()
+        if solver == "greedy":
+            xsol = self.greedy_response(demand_agents, product_set, demands, flow_limit, production_limit)
+        else:
+            xsol = self.solve_response(pairs, demand_agents, product_set, demands, flow_limit, production_limit)
+        if self.communication_manager.trace is not None:
+            self.communication_manager.record("response_input", self.name, None,
+                                              {"solver": solver,
+                                               "demands": [[j, k, demands[j, k]] for j, k in pairs],
+                                               "flow_limit": {j: flow_limit[j] for j in demand_agents},
+                                               "production_limit": production_limit,
+                                               "result": [[j, k, xsol[j, k]] for j, k in pairs]},
+                                              time.perf_counter() - start_time)
 
-        model.optimize()
-        xsol = model.getAttr('x', y)
         response_decisions = {}
         for j in demand_agents:
             response = {}
@@ -128,7 +140,7 @@ class Agent:
                                          "remaining_cap_pd": self.get_normal_remaining_capacity(),
                                          "cost_tp": cost_tp,
                                          "remaining_cap_tp": transportation.get_normal_available_capacity(self.name, ag_name)}})
-            response_decisions[j] = {"demandAgent": self.communication_manager.received_request[j]["reqFromAgent"],
+            response_decisions[j] = {"demandAgent": requests[j].sender,
                                      "response": response}
 
         # response_decisions["agentname"] = {"demandAgent": 1,
@@ -137,77 +149,164 @@ class Agent:
         #                                         "k2": {"amount": 1, "unit_cost": 1}}}
         return response_decisions
 
+    # MILP gurobi model of the response, built once for each request structure and only updated afterwards
+    def solve_response(self, pairs, demand_agents, product_set, demands, flow_limit, production_limit):
+        template = self.optimization_manager.get_template("response_optimizer", tuple(pairs))
+        if template is None:
+            model = gp.Model('response_optimizer', env=optimization_manager.get_env())
+            y = model.addVars(pairs, vtype=GRB.INTEGER, name="max_flow")
+
+            obj = model.setObjective(gp.quicksum(demands[j, k] - y[j, k]
+                                                 for j in demand_agents for k in product_set[j]), GRB.MINIMIZE)
+
+            tp_constrs = model.addConstrs((gp.quicksum(y[j, k] for k in product_set[j]) <= flow_limit[j]
+                                           for j in demand_agents), name="tp_limit")
+            pd_constrs = model.addConstr(gp.quicksum(y[j, k] for j in demand_agents for k in product_set[j])
+                                          <= production_limit, name="pd_limit")
+            demand_constrs = model.addConstrs((y[j, k] <= demands[j, k] for j in demand_agents for k in product_set[j]),
+                                              name="demand_limit")
+            self.optimization_manager.add_template("response_optimizer", tuple(pairs),
+                                                   {"model": model, "y": y, "tp_limit": tp_constrs,
+                                                    "pd_limit": pd_constrs, "demand_limit": demand_constrs})
+        else:
+            model = template["model"]
+            # discard the previous solution so that the result is the same as a newly built model
+            model.reset()
+            y = template["y"]
+            # the objective coefficients are fixed, only the constant term depends on the demands
+            model.ObjCon = sum(demands[j, k] for j in demand_agents for k in product_set[j])
+            for j in demand_agents:
+                template["tp_limit"][j].RHS = flow_limit[j]
+                for k in product_set[j]:
+                    template["demand_limit"][j, k].RHS = demands[j, k]
+            template["pd_limit"].RHS = production_limit
+
+        model.optimize()
+        return model.getAttr('x', y)
+
+    # closed-form response: the unmet quantity only depends on the total response, which is limited by the flow limit
+    # of each link, the production limit and the demands, so filling the requests in order is optimal
+    def greedy_response(self, demand_agents, product_set, demands, flow_limit, production_limit):
+        # same as the MILP, no response exists when a limit is already exceeded
+        if production_limit < -1e-6 or any(flow_limit[j] < -1e-6 for j in demand_agents):
+            raise ValueError("%s cannot find a feasible response" % self.name)
+        remaining_pd = math.floor(production_limit + 1e-6)
+        xsol = {}
+        for j in demand_agents:
+            remaining_tp = math.floor(flow_limit[j] + 1e-6)
+            for k in product_set[j]:
+                amount = max(0, min(math.floor(demands[j, k] + 1e-6), remaining_tp, remaining_pd))
+                xsol[j, k] = float(amount)
+                remaining_tp -= amount
+                remaining_pd -= amount
+        return xsol
+
     # supplier agent sends response to demand agents
     def send_response(self, response_decision):
         for name in response_decision.keys():
             ag_dm = response_decision[name]["demandAgent"]
             resp = response_decision[name]["response"]
-            self.communication_manager.delivered_response[ag_dm.name] = {"response": resp, "respToAgent": ag_dm}
-            ag_dm.communication_manager.received_response[self.name] = {"response": resp,  "reqFromAgent": self}
+            self.communication_manager.send(communication_manager.Response(self, ag_dm, resp))
 
     # demand agent selects suppliers
     def supplier_selector(self):
-        model = gp.Model('Supplier_selector')
-        model.Params.LogToConsole = 0
-        supplier_agents = self.communication_manager.received_response.keys()
+        start_time = time.perf_counter()
         response = {}
-        for ag_name in supplier_agents:
-            response[ag_name] = self.communication_manager.received_response[ag_name]["response"]
+        for message in self.communication_manager.received_responses():
+            response[message.sender.name] = message.offers
+        supplier_agents = response.keys()
 
         pairs = [(i, k) for i in supplier_agents for k in response[i].keys()]
-        # separate the production and flow that are within capacity and over capacity
-        x_pd = model.addVars(pairs, vtype=GRB.INTEGER, name="pd")
-        x_tp = model.addVars(pairs, vtype=GRB.INTEGER, name="flow")
-        x_over_pd = model.addVars(pairs, vtype=GRB.INTEGER, name="over_pd")
-        x_over_tp = model.addVars(pairs, vtype=GRB.INTEGER, name="over_tp")
-
-        obj = model.setObjective(gp.quicksum(response[i][k]["cost_pd"] * x_pd[i, k] + 2 * response[i][k]["cost_pd"] * x_over_pd[i, k]
-                                             + response[i][k]["cost_tp"] * x_tp[i, k] + 2 * response[i][k]["cost_tp"] * x_over_tp[i, k]
-                                             - 1e8*(x_pd[i, k]+x_over_pd[i, k])
-                                             for i in supplier_agents for k in response[i].keys()), GRB.MINIMIZE)
-
-        resp_constrs_pd = model.addConstrs((x_pd[i, k]+x_over_pd[i, k] <= response[i][k]["amount"]
-                                       for i in supplier_agents for k in response[i].keys()), name="resp_limit_pd")
-
-        resp_constrs_tp = model.addConstrs((x_tp[i, k] + x_over_tp[i, k] <= response[i][k]["amount"]
-                                         for i in supplier_agents for k in response[i].keys()), name="resp_limit_tp")
-
-        capacity_constrs_pd = model.addConstrs((gp.quicksum(x_pd[i, k] for k in response[i].keys()) <= response[i][k]["remaining_cap_pd"]
-                                         for i in supplier_agents for k in response[i].keys()), name="capacity_limit_pd")
-
-        capacity_constrs_tp = model.addConstrs(
-            (gp.quicksum(x_tp[i, k] for k in response[i].keys()) <= response[i][k]["remaining_cap_tp"]
-             for i in supplier_agents for k in response[i].keys()), name="capacity_limit_tp")
-
-        balance = model.addConstrs((x_tp[i, k] + x_over_tp[i, k] == x_pd[i, k] + x_over_pd[i, k]
-             for i in supplier_agents for k in response[i].keys()), name="capacity_limit_tp")
-
-        demand_constrs = model.addConstrs((gp.quicksum(x_pd[i, k]+x_over_pd[i, k] for i in supplier_agents if k in response[i]) <= self.demand[k]
-                                           for k in self.demand.keys()), name="demand_limit")
+        if len(pairs) == 0:
+            return {}, {}
+        offering_agents = [i for i in supplier_agents if len(response[i].keys()) != 0]
+        products = list(self.demand.keys())
+        n = len(pairs)
+
+        # cost, response amount and capacity of each (supplier, product) pair
+        cost_pd = np.array([response[i][k]["cost_pd"] for i, k in pairs], dtype=float)
+        cost_tp = np.array([response[i][k]["cost_tp"] for i, k in pairs], dtype=float)
+        amount = np.array([response[i][k]["amount"] for i, k in pairs], dtype=float)
+        # the remaining capacity is the same for all the products in a response, so one limit for each supplier
+        cap_pd = np.array([min(response[i][k]["remaining_cap_pd"] for k in response[i].keys())
+                           for i in offering_agents], dtype=float)
+        cap_tp = np.array([min(response[i][k]["remaining_cap_tp"] for k in response[i].keys())
+                           for i in offering_agents], dtype=float)
+        demand = np.array([self.demand[k] for k in products], dtype=float)
+
+        # x = [pd, over_pd, tp, over_tp]: the production and flow that are within capacity and over capacity
+        # minimize the cost and reward the selected production
+        obj = np.concatenate([cost_pd - 1e8, 2 * cost_pd - 1e8, cost_tp, 2 * cost_tp])
+        rhs = np.concatenate([amount, amount, cap_pd, cap_tp, np.zeros(n), demand])
+
+        signature = (tuple(pairs), tuple(products))
+        template = self.optimization_manager.get_template("supplier_selector", signature)
+        if template is None:
+            model = gp.Model('Supplier_selector', env=optimization_manager.get_env())
+            x = model.addMVar(4 * n, vtype=GRB.INTEGER, name="x")
+            model.setObjective(obj @ x, GRB.MINIMIZE)
+
+            # incidence matrices of the pairs to the suppliers and to the demanded products
+            agent_index = {i: row for row, i in enumerate(offering_agents)}
+            product_index = {k: row for row, k in enumerate(products)}
+            col = np.arange(n)
+            supplier = sp.csr_matrix((np.ones(n), ([agent_index[i] for i, k in pairs], col)),
+                                     shape=(len(offering_agents), n))
+            demanded = [p for p, (i, k) in enumerate(pairs) if k in product_index]
+            product = sp.csr_matrix((np.ones(len(demanded)), ([product_index[pairs[p][1]] for p in demanded], demanded)),
+                                    shape=(len(products), n))
+            eye = sp.identity(n, format="csr")
+            zero_s = sp.csr_matrix((len(offering_agents), n))
+            zero_k = sp.csr_matrix((len(products), n))
+            zero_n = sp.csr_matrix((n, n))
+            A = sp.bmat([[eye, eye, zero_n, zero_n],  # response limit of production
+                         [zero_n, zero_n, eye, eye],  # response limit of flow
+                         [supplier, zero_s, zero_s, zero_s],  # capacity limit of production
+                         [zero_s, zero_s, supplier, zero_s],  # capacity limit of flow
+                         [-eye, -eye, eye, eye],  # flow balance
+                         [product, product, zero_k, zero_k]],  # demand limit
+                        format="csr")
+            sense = np.full(A.shape[0], GRB.LESS_EQUAL)
+            sense[2 * n + 2 * len(offering_agents):3 * n + 2 * len(offering_agents)] = GRB.EQUAL
+            constrs = model.addMConstr(A, x, sense, rhs, name="selector")
+            self.optimization_manager.add_template("supplier_selector", signature,
+                                                   {"model": model, "x": x, "constrs": constrs})
+        else:
+            model = template["model"]
+            # discard the previous solution so that the result is the same as a newly built model
+            model.reset()
+            x = template["x"]
+            x.Obj = obj
+            template["constrs"].RHS = rhs
 
         model.optimize()
-        xsol = model.getAttr('x', x_pd)
-        x_over_sol = model.getAttr('x', x_over_pd)
+        xsol = x.X
+        selected = xsol[:n] + xsol[n:2 * n]
         selection_decision = {}
-        for i in supplier_agents:
-            selection_decision[i] = {}
-            for k in response[i].keys():
-                if xsol[i, k]+x_over_sol[i, k] > 0.1:
-                    selection_decision[i].update({k: xsol[i, k]+x_over_sol[i, k]})
-            if len(selection_decision[i].keys()) == 0:
-                selection_decision.pop(i)
+        for p, (i, k) in enumerate(pairs):
+            if selected[p] > 0.1:
+                try:
+                    selection_decision[i].update({k: float(selected[p])})
+                except:
+                    selection_decision[i] = {k: float(selected[p])}
 
         # selection_decision["supplier_name"] = {"k1": 1, "k2": 1}
+        if self.communication_manager.trace is not None:
+            self.communication_manager.record("selection_input", self.name, None,
+                                              {"demand": self.demand, "responses": response,
+                                               "result": selection_decision},
+                                              time.perf_counter() - start_time)
         new_flows = {}
         for sup_name in selection_decision.keys():
             for product in selection_decision[sup_name]:
                 new_flows[(sup_name, self.name, product)] = selection_decision[sup_name][product]
-        
+
         return selection_decision, new_flows
 
     # demand agent check demand
     def check_demand(self, new_flows):
         flag = True
+        self.record_change("demand")
         for product in list(self.demand.keys()):
             actual_get = 0
             for flow in new_flows.items():
@@ -283,9 +382,6 @@ class Agent:
 
     # determine which downstream agents are affected and cancel their related production
     def cancel_downstream_production(self, agent_network):
-        model = gp.Model('Cancel_downstream_production')
-        model.Params.LogToConsole = 0
-
         # Get the downstream products that might be affected
         potential_affected_product = set()
         potential_affected_outflow = set()
@@ -311,13 +407,30 @@ class Agent:
                     downstream[final_prod].append(flow[0])
 
         pairs = [(j, k) for k in K for j in downstream[k]]
-        x = model.addVars(pairs, vtype=GRB.INTEGER, name="cancelled_production")
-        # minimize the total cancelled production
-        obj = model.setObjective(gp.quicksum(x[j, k] for k in K for j in downstream[k]), GRB.MINIMIZE)
-
-        demand_constrs = model.addConstrs((gp.quicksum(gp.quicksum(x[j, k] for j in downstream[k]) * self.capability.characteristics["Production"][k]["Material"][c] for k in product_structure[c]) >= self.demand[c]
-                                           for c in self.demand.keys()), name="demand_limit")
-        flow_constrs = model.addConstrs((x[j, k] <= self.state.outflow[(j, k)] for k in K for j in downstream[k]), name="downflow_limit")
+        signature = (tuple(pairs), tuple(self.demand.keys()))
+        template = self.optimization_manager.get_template("cancel_downstream_production", signature)
+        if template is None:
+            model = gp.Model('Cancel_downstream_production', env=optimization_manager.get_env())
+            x = model.addVars(pairs, vtype=GRB.INTEGER, name="cancelled_production")
+            # minimize the total cancelled production
+            obj = model.setObjective(gp.quicksum(x[j, k] for k in K for j in downstream[k]), GRB.MINIMIZE)
+
+            demand_constrs = model.addConstrs((gp.quicksum(gp.quicksum(x[j, k] for j in downstream[k]) * self.capability.characteristics["Production"][k]["Material"][c] for k in product_structure[c]) >= self.demand[c]
+                                               for c in self.demand.keys()), name="demand_limit")
+            flow_constrs = model.addConstrs((x[j, k] <= self.state.outflow[(j, k)] for k in K for j in downstream[k]), name="downflow_limit")
+            self.optimization_manager.add_template("cancel_downstream_production", signature,
+                                                   {"model": model, "x": x, "demand_limit": demand_constrs,
+                                                    "downflow_limit": flow_constrs})
+        else:
+            model = template["model"]
+            # discard the previous solution so that the result is the same as a newly built model
+            model.reset()
+            x = template["x"]
+            for c in self.demand.keys():
+                template["demand_limit"][c].RHS = self.demand[c]
+            for k in K:
+                for j in downstream[k]:
+                    template["downflow_limit"][k, j].RHS = self.state.outflow[(j, k)]
 
         model.optimize()
         xsol = model.getAttr('x', x)
@@ -341,8 +454,11 @@ class Agent:
             self.state.update_prod_inv("production", prod, -reduced_production[prod])
             # ripple effects to other upstream agents of the cancelled-production agents
             self.cancel_upstream_production(agent_network)
+            self.record_change("demand")
             self.demand.clear()
-        outflow_agents = set()
+        # downstream agents in the order of the reduced outflows, a set of agents would be visited in the order of
+        # their memory addresses
+        outflow_agents = {}
         for flow in reduced_outflow.keys():
             self.state.update_flow("outflow", flow[0], flow[1], -reduced_outflow[flow])
 
@@ -350,18 +466,23 @@ class Agent:
             downstream_agent.state.update_flow("inflow", self.name, flow[1], -reduced_outflow[flow])
             transportation.update_flow((self.name, flow[0], flow[1]), -reduced_outflow[flow])
             agent_network.occurred_communication += 1
+            self.communication_manager.record("cancel_downstream", self.name, flow[0], {flow[1]: reduced_outflow[flow]})
             if "Customer" not in downstream_agent.name:
+                downstream_agent.record_change("demand")
                 downstream_agent.demand[flow[1]] = reduced_outflow[flow]
-                outflow_agents.add(downstream_agent)
+                outflow_agents[downstream_agent.name] = downstream_agent
         # ripple effects to the downstream agents of the cancelled-production agents
-        for downstream_agent in outflow_agents:
+        for downstream_agent in outflow_agents.values():
             downstream_agent.cancel_downstream_production(agent_network)
 
     # determine which upstream agents are affected and cancel their related production
+    # the ripple effects on the agents further upstream are handled in the same wave, see cancel_upstream_wave
     def cancel_upstream_production(self, agent_network):
-        model = gp.Model('Cancel_upstream_production')
-        model.Params.LogToConsole = 0
+        cancel_upstream_wave(agent_network, [self])
 
+    # cancel the inflows that are no longer needed by the current production of the agent,
+    # the upstream agents lose the cancelled production and outflows but are not processed here
+    def reduce_inflow(self, agent_network):
         # identify the upstream agents
         upstream = {}
         up_agent = set()
@@ -388,27 +509,99 @@ class Agent:
                                          self.capability.characteristics["Production"][prod]["Material"][component]
 
         pairs = [(i, k) for k in upstream.keys() for i in upstream[k]]
-        x = model.addVars(pairs, vtype=GRB.INTEGER, name="remaining_production")
-        # minimize the total cancelled flow
-        obj = model.setObjective(gp.quicksum(self.state.inflow[(i, k)] - x[i, k] for k in upstream.keys() for i in upstream[k]), GRB.MINIMIZE)
-
-        demand_constrs = model.addConstrs((gp.quicksum(x[i, k] for i in upstream[k]) <= total_need[k] for k in upstream.keys()), name="demand_limit")
-
-        model.optimize()
-        xsol = model.getAttr('x', x)
+        if all(sum(self.state.inflow[(i, k)] for i in upstream[k]) <= total_need[k] + 1e-6 for k in upstream.keys()):
+            # the inflows are all needed, nothing to cancel
+            xsol = {(i, k): self.state.inflow[(i, k)] for i, k in pairs}
+        elif len(upstream.keys()) == 1:
+            # closed form for one product: keep the inflows in order until the need is covered
+            xsol = {}
+            remaining = math.floor(total_need[pairs[0][1]] + 1e-6)
+            for i, k in pairs:
+                xsol[i, k] = float(max(0, min(math.floor(self.state.inflow[(i, k)] + 1e-6), remaining)))
+                remaining -= xsol[i, k]
+        else:
+            xsol = self.solve_reduce_inflow(pairs, upstream, total_need)
 
         # update the production and flow in the network
         transportation = network.find_agent_by_name(agent_network, "Transportation")
-        for k in upstream.keys():
-            for i in upstream[k]:
-                initial_flow = self.state.inflow[(i, k)]
-                self.state.update_flow("inflow", i, k, xsol[i, k] - initial_flow)
-                transportation.update_flow((i, self.name, k), xsol[i, k] - initial_flow)
-                ag = network.find_agent_by_name(agent_network, i)
-                ag.state.update_prod_inv("production", k, xsol[i, k] - initial_flow)
-                ag.state.update_flow("outflow", self.name, k, xsol[i, k] - initial_flow)
-                # ripple effects
-                if len(ag.state.inflow.keys()) != 0:
-                    ag.cancel_upstream_production(agent_network)
+        cancelled = {i: {} for i in up_agent}
+        for i, k in pairs:
+            initial_flow = self.state.inflow[(i, k)]
+            cancelled[i][k] = initial_flow - xsol[i, k]
+            if abs(xsol[i, k] - initial_flow) < 1e-9:
+                continue
+            self.state.update_flow("inflow", i, k, xsol[i, k] - initial_flow)
+            transportation.update_flow((i, self.name, k), xsol[i, k] - initial_flow)
+            ag = network.find_agent_by_name(agent_network, i)
+            ag.state.update_prod_inv("production", k, xsol[i, k] - initial_flow)
+            ag.state.update_flow("outflow", self.name, k, xsol[i, k] - initial_flow)
 
         agent_network.occurred_communication += len(up_agent)
+        for i in cancelled:
+            self.communication_manager.record("cancel_upstream", self.name, i, cancelled[i])
+
+    # MILP gurobi model of the remaining inflows, the cancelled inflow is minimized and no inflow is increased
+    def solve_reduce_inflow(self, pairs, upstream, total_need):
+        template = self.optimization_manager.get_template("cancel_upstream_production", tuple(pairs))
+        if template is None:
+            model = gp.Model('Cancel_upstream_production', env=optimization_manager.get_env())
+            x = model.addVars(pairs, vtype=GRB.INTEGER, ub={(i, k): self.state.inflow[(i, k)] for i, k in pairs},
+                              name="remaining_production")
+            # minimize the total cancelled flow
+            obj = model.setObjective(gp.quicksum(self.state.inflow[(i, k)] - x[i, k] for k in upstream.keys() for i in upstream[k]), GRB.MINIMIZE)
+
+            demand_constrs = model.addConstrs((gp.quicksum(x[i, k] for i in upstream[k]) <= total_need[k] for k in upstream.keys()), name="demand_limit")
+            self.optimization_manager.add_template("cancel_upstream_production", tuple(pairs),
+                                                   {"model": model, "x": x, "demand_limit": demand_constrs})
+        else:
+            model = template["model"]
+            # discard the previous solution so that the result is the same as a newly built model
+            model.reset()
+            x = template["x"]
+            # the objective coefficients are fixed, only the constant term depends on the current inflow
+            model.ObjCon = sum(self.state.inflow[(i, k)] for k in upstream.keys() for i in upstream[k])
+            for i, k in pairs:
+                x[i, k].UB = self.state.inflow[(i, k)]
+            for k in upstream.keys():
+                template["demand_limit"][k].RHS = total_need[k]
+
+        model.optimize()
+        return model.getAttr('x', x)
+
+
+# Cancel the production and flows that are no longer needed upstream of start_agents after their production is reduced
+# The agents are visited downstream first (reverse topological order of the inflows), so each agent reduces its inflows
+# at most once per wave, after the reductions from all its downstream agents in the wave are merged in its production
+def cancel_upstream_wave(agent_network, start_agents):
+    # agents upstream of the start agents through the current inflows, the cancellation only removes inflows
+    agents = {ag.name: ag for ag in start_agents}
+    upstream = {}
+    waiting = {name: 0 for name in agents}  # downstream agents in the wave that are not processed yet
+    queue = deque(agents.values())
+    while len(queue) != 0:
+        ag = queue.popleft()
+        upstream[ag.name] = [network.find_agent_by_name(agent_network, name)
+                             for name in dict.fromkeys(flow[0] for flow in ag.state.inflow.keys())]
+        for up_ag in upstream[ag.name]:
+            if up_ag.name not in agents:
+                agents[up_ag.name] = up_ag
+                waiting[up_ag.name] = 0
+                queue.append(up_ag)
+            waiting[up_ag.name] += 1
+
+    ready = deque(ag for ag in agents.values() if waiting[ag.name] == 0)
+    processed = set()
+    while len(processed) < len(agents):
+        if len(ready) == 0:
+            # flows in a cycle, continue with the first agent found that is not processed
+            ready.append(next(ag for ag in agents.values() if ag.name not in processed))
+        ag = ready.popleft()
+        if ag.name in processed:
+            continue
+        processed.add(ag.name)
+        if len(ag.state.inflow.keys()) != 0:
+            ag.reduce_inflow(agent_network)
+        for up_ag in upstream[ag.name]:
+            waiting[up_ag.name] -= 1
+            if waiting[up_ag.name] == 0:
+                ready.append(up_ag)
@@ -14,15 +14,97 @@ class TransportationAgent(Agent):
     def __init__(self, name):
         Agent.__init__(self, name, "Transportation")
         self.flow = dict()
+        # total flow on each edge (source, dest), kept in sync with self.flow
+        self.edge_flow = dict()
+        # flows changed since the changes are tracked, None when they are not tracked
+        self.changed_flows = None
+        self.changed_agents = None
+        # undo log shared by the network, None when the changes are not journaled
+        self.journal = None
         self.flow_change = 0
         self.flow_added = 0
+
     def update_flow(self, flow, change):
+        self.mark_changed(flow)
+        previous = self.flow.get(flow, 0)
         try:
             self.flow[flow] += change
         except:
             self.flow[flow] = change
         if self.flow[flow] - 0 < 0.1:
             self.flow.pop(flow)
+        self.update_edge_flow(flow, self.flow.get(flow, 0) - previous)
+
+    # remove a flow and return its amount
+    def remove_flow(self, flow):
+        self.mark_changed(flow)
+        amount = self.flow.pop(flow)
+        self.update_edge_flow(flow, -amount)
+        return amount
+
+    # replace all the flows, e.g., when assigning a plan
+    def set_flows(self, flows):
+        for flow in list(self.flow.keys()) + list(flows.keys()):
+            self.mark_changed(flow)
+        self.clear_edge_flow()
+        self.flow = flows.copy()
+        for flow in self.flow.keys():
+            self.update_edge_flow(flow, self.flow[flow])
+
+    def clear_flow(self):
+        for flow in self.flow.keys():
+            self.mark_changed(flow)
+        self.flow.clear()
+        self.clear_edge_flow()
+
+    def clear_edge_flow(self):
+        if self.journal is not None:
+            for edge in self.edge_flow.keys():
+                self.journal.record(self.name, self, "edge_flow", edge)
+        self.edge_flow.clear()
+
+    def update_edge_flow(self, flow, change):
+        edge = (flow[0], flow[1])
+        if self.journal is not None:
+            self.journal.record(self.name, self, "edge_flow", edge)
+        try:
+            self.edge_flow[edge] += change
+        except:
+            self.edge_flow[edge] = change
+        # every remaining flow is at least 0.1, so a smaller total means the edge is empty
+        if self.edge_flow[edge] < 0.1:
+            self.edge_flow.pop(edge)
+
+    # record the changed flows and the name of this agent in changed_agents
+    def track_changes(self, changed_agents):
+        self.changed_agents = changed_agents
+        self.changed_flows = set()
+
+    # record the old flows in the journal whenever they change
+    def attach_journal(self, journal):
+        self.journal = journal
+
+    # called before self.flow[flow] changes
+    def mark_changed(self, flow):
+        if self.changed_flows is not None:
+            self.changed_flows.add(flow)
+            self.changed_agents.add(self.name)
+        if self.journal is not None:
+            self.journal.record(self.name, self, "flow", flow)
+
+    # restore the flows and the edge totals from their snapshots if any flow changed
+    # the dicts are copied back as a whole, restoring the changed flows one by one would change the order of the
+    # flows (and so the order of the later decisions) and leave rounding errors in the edge totals
+    def restore_flows(self, snapshot, edge_snapshot):
+        if len(self.changed_flows) != 0:
+            self.flow = snapshot.copy()
+            self.edge_flow = edge_snapshot.copy()
+        self.changed_flows.clear()
+
+    # calculate the total flow in this edge
+    def get_transportaion_amount(self, source, dest):
+        return self.edge_flow.get((source, dest), 0)
+
     # agent checks its current knowledge for response
     def check_request(self, requestingAgent, product, unit):
         # TODO: determine the amount of product it can provide
@@ -51,19 +133,13 @@ class TransportationAgent(Agent):
 
     def get_available_capacity(self, start, end, overcapacity_multiplier):
         capacity = self.capability.characteristics["Transportation"][(start, end)]["Capacity"] * overcapacity_multiplier
-        used_capacity = 0
-        for key in self.flow.keys():
-            if start == key[0] and end == key[1]:
-                used_capacity += self.flow[key]
+        used_capacity = self.get_transportaion_amount(start, end)
 
         return capacity-used_capacity
 
     def get_normal_available_capacity(self, start, end):
         capacity = self.capability.characteristics["Transportation"][(start, end)]["Capacity"]
-        used_capacity = 0
-        for key in self.flow.keys():
-            if start == key[0] and end == key[1]:
-                used_capacity += self.flow[key]
+        used_capacity = self.get_transportaion_amount(start, end)
 
         return max(0, capacity-used_capacity)
 
@@ -44,7 +44,7 @@ def calculate_degrees(agent):
                 com_agents.append(ag.name)
     for product in agent.environment.clustering_agent.keys():
         for ag in agent.environment.clustering_agent[product]:
-            if ag.name not in com_agents:
+            if ag is not agent and ag.name not in com_agents:
                 com_agents.append(ag.name)
     com_degree = len(com_agents)
 
@@ -56,10 +56,12 @@ def calculate_capability_capacity(agent):
     capacity_utility = {}
     for product in agent.capability.knowledge["Production"]:
         try:
-            capability_redundancy[product] = len(agent.environment.clustering_agent[product])
+            # the other agents of the cluster
+            cluster = [ag for ag in agent.environment.clustering_agent[product] if ag is not agent]
+            capability_redundancy[product] = len(cluster)
             total_cap = 0
             total_remain = 0
-            for ag in agent.environment.clustering_agent[product]:
+            for ag in cluster:
                 total_cap += ag.capability.get_capacity()
                 total_remain += ag.get_remaining_capacity()
             capacity_proportion[product] = agent.capability.get_capacity() / (agent.capability.get_capacity() + total_cap)
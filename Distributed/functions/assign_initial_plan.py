@@ -21,7 +21,7 @@ def assign_initial_flow(ag_network, file_name):
         flows[(fl['Source'], fl['Dest'], fl['Product'])] = fl["Value"]
 
     tp = network.find_agent_by_name(ag_network, "Transportation")
-    tp.flow = flows.copy()
+    tp.set_flows(flows)
 
     for key in tp.flow.keys():
         start = network.find_agent_by_name(ag_network, key[0])
@@ -49,7 +49,7 @@ def re_initilize_network(ag_network, file_name):
             ag.state.clear_state()
             # ag.communication_manager.clear_message()
             if ag.name == "Transportation":
-                ag.flow.clear()
+                ag.clear_flow()
             if "Customer" not in ag.name:
                 ag.demand.clear()
     ag_network.occurred_communication = 0
@@ -8,13 +8,18 @@
 """
 
 from Distributed.initialization import network
+from Distributed.agent import agent
+from Distributed.functions import negotiation_engine
 from termcolor import colored
 
 # Identify disruption and update the network based on the disruption
 def disruption_adaptation(agent_network, disrupted_agent):
     find_solution = True
+    if agent_network.trace is not None:
+        agent_network.trace.start_case(disrupted_agent)
     # identify disruption
     disrupted_node = network.find_agent_by_name(agent_network, disrupted_agent)
+    disrupted_node.record_change("down")
     disrupted_node.down = True
     lost_production = [disrupted_node.state.production.copy()]
     lost_flow = []
@@ -28,24 +33,24 @@ def disruption_adaptation(agent_network, disrupted_agent):
 
     # update the production and flows of the upstream and downstream agents
     related_agent = []
-    propagation_agent = set()
+    propagation_agent = []
     for f in lost_flow:  # f = ((source, destination, product), amount)
-        transportation.flow.pop(f[0])
+        transportation.remove_flow(f[0])
         if disrupted_node.name == f[0][1]:  # inflow to lost agent
             up_agent = network.find_agent_by_name(agent_network, f[0][0])
             if up_agent.name not in related_agent: related_agent.append(up_agent.name)
             up_agent.state.update_prod_inv("production", f[0][2], -f[1])
-            up_agent.state.outflow.pop((f[0][1], f[0][2]))
-            if len(up_agent.state.inflow.keys()) != 0:
-                propagation_agent.add(up_agent)
+            up_agent.state.remove_flow("outflow", f[0][1], f[0][2])
+            if len(up_agent.state.inflow.keys()) != 0 and up_agent not in propagation_agent:
+                propagation_agent.append(up_agent)
 
         if disrupted_node.name == f[0][0]:  # outflow from lost agent
             down_agent = network.find_agent_by_name(agent_network, f[0][1])
-            down_agent.state.inflow.pop((f[0][0], f[0][2]))
+            down_agent.state.remove_flow("inflow", f[0][0], f[0][2])
             if down_agent.name not in related_agent: related_agent.append(down_agent.name)
 
-    for ag in propagation_agent:
-        ag.cancel_upstream_production(agent_network)
+    # one cancellation wave from all the upstream agents that lost outflows
+    agent.cancel_upstream_wave(agent_network, propagation_agent)
 
     # print the disruption
     print(colored("Disrupted agent:", 'magenta'), disrupted_node.name)
@@ -59,6 +64,10 @@ def disruption_adaptation(agent_network, disrupted_agent):
     # identify demand agents
     demand_agents = disrupted_node.find_demand_agents(agent_network, lost_production, lost_flow)
     agent_network.occurred_communication = len(demand_agents) + len(related_agent)
+    for ag in demand_agents:
+        disrupted_node.communication_manager.record("notification", disrupted_node.name, ag.name, ag.demand)
+    for name in related_agent:
+        disrupted_node.communication_manager.record("notification", disrupted_node.name, name, {})
 
     # generate new flows by agent communication
     final_new_flows = {}
@@ -73,6 +82,7 @@ def disruption_adaptation(agent_network, disrupted_agent):
             ag_sup = network.find_agent_by_name(agent_network, sup_name)
             # Here we assume no inventory, so each supplier agent will require materials if they need
             if ag_sup.capability.does_need_materials():
+                ag_sup.record_change("demand")
                 ag_sup.demand = ag_sup.find_needed_materials(new_production[sup_name])
                 demand_agents.append(ag_sup)
 
@@ -86,29 +96,50 @@ def supplier_reselection(agent_network, demand_agents, transportation, find_solu
     new_flows = {}
     new_productions = {}
     while len(demand_agents) != 0:
-        total_supplier_agents = {}
-        # all the demand_agents send request
-        for ag_dm in demand_agents:
-            supplier_agents = ag_dm.exploration(agent_network)
-            total_supplier_agents[ag_dm.name] = supplier_agents
-            ag_dm.send_request(supplier_agents)
-            agent_network.occurred_communication += len(ag_dm.communication_manager.delivered_request.keys())
+        if agent_network.trace is not None:
+            agent_network.trace.next_round()
+        if agent_network.negotiation == "async":
+            # the agents request and respond concurrently, the responses are received in the lock-step order
+            total_supplier_agents, round_solution = negotiation_engine.negotiate_round(
+                agent_network, demand_agents, transportation)
+            find_solution = find_solution and round_solution
+        else:
+            total_supplier_agents = {}
+            # all the demand_agents send request
+            for ag_dm in demand_agents:
+                supplier_agents = ag_dm.exploration(agent_network)
+                total_supplier_agents[ag_dm.name] = supplier_agents
+                ag_dm.send_request(supplier_agents)
+                agent_network.occurred_communication += len(ag_dm.communication_manager.delivered_requests())
 
-        # all the supplier_agents determine response
-        supplier_agents_considered = []  # used for avoiding same supplier agents make decisions more than 1 time
-        for ag_dm in demand_agents:
-            for product in total_supplier_agents[ag_dm.name].keys():
-                for ag_sup in total_supplier_agents[ag_dm.name][product]:
-                    if ag_sup.name not in supplier_agents_considered:
-                        try:
-                            response_decision = ag_sup.response_optimizer(transportation)
-                        except:
-                            print(ag_sup.name, "cannot find response to", ag_dm.name)
-                            find_solution = False
-                        ag_sup.send_response(response_decision)
-                        supplier_agents_considered.append(ag_sup.name)
-                        agent_network.occurred_communication += len(
-                            ag_sup.communication_manager.delivered_response.keys())
+            # all the supplier_agents determine response
+            supplier_agents_considered = []  # used for avoiding same supplier agents make decisions more than 1 time
+            responding_agents = []  # (supplier agent, first demand agent requesting it)
+            for ag_dm in demand_agents:
+                for product in total_supplier_agents[ag_dm.name].keys():
+                    for ag_sup in total_supplier_agents[ag_dm.name][product]:
+                        if ag_sup.name not in supplier_agents_considered:
+                            supplier_agents_considered.append(ag_sup.name)
+                            responding_agents.append((ag_sup, ag_dm))
+            if agent_network.negotiation == "threaded":
+                # the responses only read the transportation and their own requests, so they are determined in
+                # parallel and then sent in the same order as one after another
+                executor = negotiation_engine.get_executor()
+                response_futures = [executor.submit(ag_sup.response_optimizer, transportation,
+                                                    agent_network.response_solver)
+                                    for ag_sup, ag_dm in responding_agents]
+            for n, (ag_sup, ag_dm) in enumerate(responding_agents):
+                try:
+                    if agent_network.negotiation == "threaded":
+                        response_decision = response_futures[n].result()
+                    else:
+                        response_decision = ag_sup.response_optimizer(transportation, agent_network.response_solver)
+                except:
+                    print(ag_sup.name, "cannot find response to", ag_dm.name)
+                    find_solution = False
+                    continue
+                ag_sup.send_response(response_decision)
+                agent_network.occurred_communication += len(ag_sup.communication_manager.delivered_responses())
 
         # all the demand_agents select the suppliers
         for ag_dm in demand_agents:
@@ -117,32 +148,11 @@ def supplier_reselection(agent_network, demand_agents, transportation, find_solu
             except:
                 print(ag_dm.name, "cannot find enough suppliers")
                 find_solution = False
-            new_flows.update(ag_dm_flows)
-            agent_network.occurred_communication += len(ag_dm_decision.keys())
-            for ag_sup in ag_dm_decision.keys():
-                ag = network.find_agent_by_name(agent_network, ag_sup)
-                for product in ag_dm_decision[ag_sup].keys():
-                    ag.state.update_prod_inv("production", product, ag_dm_decision[ag_sup][product])
-                try:
-                    for product in ag_dm_decision[ag_sup].keys():
-                        try:
-                            new_productions[ag_sup][product] += ag_dm_decision[ag_sup][product]
-                        except:
-                            new_productions[ag_sup].update({product: ag_dm_decision[ag_sup][product]})
-                except:
-                    new_productions[ag_sup] = ag_dm_decision[ag_sup]
-            for flow in ag_dm_flows.keys():
-                transportation.update_flow(flow, ag_dm_flows[flow])
-                source_ag = network.find_agent_by_name(agent_network, flow[0])
-                dest_ag = network.find_agent_by_name(agent_network, flow[1])
-                source_ag.state.update_flow("outflow", flow[1], flow[2], new_flows[flow])
-                dest_ag.state.update_flow("inflow", flow[0], flow[2], new_flows[flow])
-                # source_ag.communication_manager.clear_message()
-                # dest_ag.communication_manager.clear_message()
-            ag_dm.communication_manager.clear_message()
-            for prod in total_supplier_agents[ag_dm.name]:
-                for ag in total_supplier_agents[ag_dm.name][prod]:
-                    ag.communication_manager.clear_message()
+                # nothing is applied, the messages of the round are still cleared
+                clear_round_messages(ag_dm, total_supplier_agents[ag_dm.name])
+                continue
+            apply_selection(agent_network, transportation, ag_dm, ag_dm_decision, ag_dm_flows,
+                            total_supplier_agents[ag_dm.name], new_flows, new_productions)
         # demand_agents = [ag_dm for ag_dm in demand_agents if not ag_dm.check_demand(ag_dm_flows)]
 
         # demand agents check whether their demands are satisfied
@@ -174,6 +184,44 @@ def supplier_reselection(agent_network, demand_agents, transportation, find_solu
 
     return new_productions, new_flows, find_solution
 
+# demand agent applies its selection: update the production of the selected suppliers and the new flows,
+# then clear the messages of the round
+def apply_selection(agent_network, transportation, ag_dm, ag_dm_decision, ag_dm_flows, supplier_agents, new_flows,
+                    new_productions):
+    new_flows.update(ag_dm_flows)
+    agent_network.occurred_communication += len(ag_dm_decision.keys())
+    for ag_sup in ag_dm_decision.keys():
+        ag_dm.communication_manager.record("selection", ag_dm.name, ag_sup, ag_dm_decision[ag_sup])
+    for ag_sup in ag_dm_decision.keys():
+        ag = network.find_agent_by_name(agent_network, ag_sup)
+        for product in ag_dm_decision[ag_sup].keys():
+            ag.state.update_prod_inv("production", product, ag_dm_decision[ag_sup][product])
+        try:
+            for product in ag_dm_decision[ag_sup].keys():
+                try:
+                    new_productions[ag_sup][product] += ag_dm_decision[ag_sup][product]
+                except:
+                    new_productions[ag_sup].update({product: ag_dm_decision[ag_sup][product]})
+        except:
+            new_productions[ag_sup] = ag_dm_decision[ag_sup]
+    for flow in ag_dm_flows.keys():
+        transportation.update_flow(flow, ag_dm_flows[flow])
+        source_ag = network.find_agent_by_name(agent_network, flow[0])
+        dest_ag = network.find_agent_by_name(agent_network, flow[1])
+        source_ag.state.update_flow("outflow", flow[1], flow[2], new_flows[flow])
+        dest_ag.state.update_flow("inflow", flow[0], flow[2], new_flows[flow])
+        # source_ag.communication_manager.clear_message()
+        # dest_ag.communication_manager.clear_message()
+    clear_round_messages(ag_dm, supplier_agents)
+
+
+# clear the messages of a demand agent and of the supplier agents it requested
+def clear_round_messages(ag_dm, supplier_agents):
+    ag_dm.communication_manager.clear_message()
+    for prod in supplier_agents:
+        for ag in supplier_agents[prod]:
+            ag.communication_manager.clear_message()
+
 # check whether the agent has flow balance:
 # When agents cannot recover the whole production, they will inform downstream agents to consider cancelling production
 # and upstream agents to cancel transportation and then production
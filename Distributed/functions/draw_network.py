@@ -6,23 +6,25 @@
 @Desc    :   Model Based Intelligent Agent (MBIA) supply chain project
 
 """
+import os
 import pandas as pd
 import networkx as nx
 import matplotlib.pyplot as plt
 import matplotlib.colors as colors
 import matplotlib.cm as cm
 import matplotlib.lines as mlines
+from Distributed.initialization import setup_cache
 
-
-filename = '../initialization/TASE_Setup.xlsx'
-data = pd.read_excel(filename, sheet_name='Agent', index_col=[0, 4])
+# run from the repository root as the other entry points, e.g. python -m Distributed.functions.draw_network
+filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'initialization', 'TASE_Setup.xlsx')
+data = setup_cache.load_sheet(filename, 'Agent', index_col=[0, 4])
 
 # V = set(data.index.get_level_values('AgentName'))
 V = []
 for v in data.index.get_level_values('AgentName'):
     if v not in V:
         V.append(v)
-link = pd.read_excel(filename, sheet_name='Link', index_col=[0, 1])
+link = setup_cache.load_sheet(filename, 'Link', index_col=[0, 1])
 
 info = {}
 info['V_type'] = data['AgentType'].to_dict()
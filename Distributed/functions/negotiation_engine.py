@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+# -*-coding:utf-8 -*-
+"""
+@Author  :   Mingjie Bi
+@Contact :   mingjieb@umich.edu
+@Desc    :   Model Based Intelligent Agent (MBIA) supply chain project
+
+"""
+
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from Distributed.knowledgebase import communication_manager
+
+# Thread pool of the current process running the solver calls of the agents
+# the threads are kept between the rounds since each of them owns a Gurobi environment
+thread_pool = {}
+
+
+# get the thread pool of the current process, it is created at the first call
+def get_executor(max_workers=None):
+    pid = os.getpid()
+    if pid not in thread_pool:
+        # a forked worker must not reuse the threads of its parent
+        thread_pool.clear()
+        thread_pool[pid] = ThreadPoolExecutor(max_workers=max_workers)
+    return thread_pool[pid]
+
+
+# Message bus of a negotiation round
+# The messages themselves are stored in the communication managers by send_request and send_response,
+# the bus only notifies the receiver that a message of a type has arrived from a sender
+class MessageBus():
+
+    def __init__(self):
+        self.mailboxes = {}
+
+    def get_mailbox(self, receiver, message_type):
+        if (receiver, message_type) not in self.mailboxes:
+            self.mailboxes[(receiver, message_type)] = asyncio.Queue()
+        return self.mailboxes[(receiver, message_type)]
+
+    def post(self, sender, receiver, message_type):
+        self.get_mailbox(receiver, message_type).put_nowait(sender)
+
+    # wait until a message of the type has arrived from each of the senders
+    async def wait_for(self, receiver, message_type, senders):
+        pending = set(senders)
+        mailbox = self.get_mailbox(receiver, message_type)
+        while len(pending) != 0:
+            pending.discard(await mailbox.get())
+
+
+# Request and response phases of a round of supplier_reselection where each agent is a coroutine reacting to the
+# messages it receives
+# A supplier agent determines its response as soon as all its requests arrive, the solver calls run in the thread pool
+# and overlap with each other
+# The responses arrive in the order the threads finish, so they are put back in the order of the lock-step round
+# before the selection. The caller then selects and applies the suppliers of each demand agent one after another as in
+# the lock-step round, since applying a selection clears the messages of the selected supplier agents
+# Return the supplier agents explored by each demand agent and whether all the supplier agents found their responses
+def negotiate_round(agent_network, demand_agents, transportation, max_workers=None):
+    return asyncio.run(negotiation(agent_network, demand_agents, transportation, get_executor(max_workers)))
+
+
+async def negotiation(agent_network, demand_agents, transportation, executor):
+    loop = asyncio.get_running_loop()
+    bus = MessageBus()
+    find_solution = [True]
+
+    # demand agents requesting each supplier agent, in the order of demand_agents
+    total_supplier_agents = {}
+    requesters = {}
+    for ag_dm in demand_agents:
+        supplier_agents = ag_dm.exploration(agent_network)
+        total_supplier_agents[ag_dm.name] = supplier_agents
+        for product in supplier_agents.keys():
+            for ag_sup in supplier_agents[product]:
+                if ag_sup.name not in requesters:
+                    requesters[ag_sup.name] = (ag_sup, [])
+                if ag_dm.name not in requesters[ag_sup.name][1]:
+                    requesters[ag_sup.name][1].append(ag_dm.name)
+
+    async def demand_agent(ag_dm):
+        supplier_agents = total_supplier_agents[ag_dm.name]
+        ag_dm.send_request(supplier_agents)
+        agent_network.occurred_communication += len(ag_dm.communication_manager.delivered_requests())
+        suppliers = list(dict.fromkeys(ag_sup.name for product in supplier_agents.keys()
+                                       for ag_sup in supplier_agents[product]))
+        for sup_name in suppliers:
+            bus.post(ag_dm.name, sup_name, "request")
+        await bus.wait_for(ag_dm.name, "response", suppliers)
+
+    async def supplier_agent(ag_sup, demand_names):
+        await bus.wait_for(ag_sup.name, "request", demand_names)
+        try:
+            response_decision = await loop.run_in_executor(executor, ag_sup.response_optimizer, transportation,
+                                                           agent_network.response_solver)
+            ag_sup.send_response(response_decision)
+            agent_network.occurred_communication += len(ag_sup.communication_manager.delivered_responses())
+        except:
+            # the demand agents are still notified so that they do not wait for this response
+            print(ag_sup.name, "cannot find response to", demand_names[0])
+            find_solution[0] = False
+        for dm_name in demand_names:
+            bus.post(ag_sup.name, dm_name, "response")
+
+    await asyncio.gather(*[demand_agent(ag_dm) for ag_dm in demand_agents],
+                         *[supplier_agent(ag_sup, demand_names) for ag_sup, demand_names in requesters.values()])
+    # the lock-step round sends the responses in the order the supplier agents are first requested
+    response_order = {sup_name: n for n, sup_name in enumerate(requesters)}
+    for ag_dm in demand_agents:
+        sort_responses(ag_dm.communication_manager, response_order)
+    return total_supplier_agents, find_solution[0]
+
+
+# sort the received responses of a communication manager by the order of their senders, the other messages keep
+# their order
+def sort_responses(cm, sender_order):
+    responses = sorted(cm.received_responses(), key=lambda message: sender_order[message.sender.name])
+    messages = [message for message in cm.inbox if type(message) is not communication_manager.Response]
+    cm.inbox.clear()
+    cm.inbox.extend(messages + responses)
@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+# -*-coding:utf-8 -*-
+"""
+@Author  :   Mingjie Bi
+@Contact :   mingjieb@umich.edu
+@Desc    :   Model Based Intelligent Agent (MBIA) supply chain project
+
+"""
+
+import os
+import time
+import multiprocessing as mp
+from Distributed.initialization import network
+from Distributed.knowledgebase import message_trace
+from Distributed.functions.assign_initial_plan import assign_initial_flow
+from Distributed.functions.agent_attributes import calculate_attributes
+from Distributed.functions.disruption_response import disruption_adaptation
+from Distributed.functions.metrics_output import calculate_metrics, calculate_cost
+
+# Agent network and initial plan owned by the current (worker) process
+worker_state = {}
+
+
+# Build the agent network from the setup file and the initial plan for the current process
+# trace_file: JSON-lines message trace of the scenarios, a worker of the pool writes to <trace_file>.<pid>
+def initialize_worker(initial_file_name, response_solver="gurobi", negotiation="lockstep", trace_file=None):
+    agent_network = network.initialize_agent_network(network)
+    agent_network.occurred_communication = 0
+    agent_network.response_solver = response_solver
+    agent_network.negotiation = negotiation
+    if trace_file is not None:
+        if mp.current_process().name != "MainProcess":
+            trace_file = "%s.%d" % (trace_file, os.getpid())
+        network.attach_trace(agent_network, message_trace.MessageTrace(trace_file))
+    initial_flows, initial_productions, agent_with_productions = assign_initial_flow(agent_network, initial_file_name)
+    initial_flow_cost, initial_production_cost = calculate_cost(agent_network, initial_flows, initial_productions)
+    # each scenario is reset to the initial plan by restoring what it changed
+    network.take_snapshot(agent_network)
+
+    worker_state.update({"agent_network": agent_network,
+                         "initial_file_name": initial_file_name,
+                         "initial_flows": initial_flows,
+                         "initial_productions": initial_productions,
+                         "initial_flow_cost": initial_flow_cost,
+                         "initial_production_cost": initial_production_cost})
+    return agent_with_productions
+
+
+# Run the scenario of losing one agent and reset the network back to the initial plan
+def run_scenario(ag_name):
+    agent_network = worker_state["agent_network"]
+    initial_flows = worker_state["initial_flows"]
+    initial_productions = worker_state["initial_productions"]
+
+    attributes = calculate_attributes(agent_network, ag_name, initial_flows, initial_productions)
+    # Disruption scenario
+    start_time = time.time()
+    found_solution = disruption_adaptation(agent_network, ag_name)
+    end_time = time.time()
+
+    run_time = end_time - start_time
+    results = calculate_metrics(agent_network, initial_flows, initial_productions, run_time,
+                                worker_state["initial_flow_cost"], worker_state["initial_production_cost"])
+
+    if agent_network.trace is not None:
+        agent_network.trace.flush()
+
+    # Update the network back to initial plan
+    network.restore_snapshot(agent_network)
+    return ag_name, {"attributes": attributes, "results": results}, found_solution
+
+
+# Spread the single-agent-loss scenarios over a process pool, each worker owns its own network.
+# Results are yielded in the order of agent_names as soon as they are available.
+def run_disruption_sweep(agent_names, initial_file_name, processes=None, response_solver="gurobi",
+                         negotiation="lockstep", trace_file=None):
+    if processes == 1:
+        initialize_worker(initial_file_name, response_solver, negotiation, trace_file)
+        for ag_name in agent_names:
+            yield run_scenario(ag_name)
+        return
+
+    with mp.Pool(processes=processes, initializer=initialize_worker, initargs=(initial_file_name, response_solver, negotiation, trace_file)) as pool:
+        for result in pool.imap(run_scenario, agent_names, chunksize=1):
+            yield result
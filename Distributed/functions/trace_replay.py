@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+# -*-coding:utf-8 -*-
+"""
+@Author  :   Mingjie Bi
+@Contact :   mingjieb@umich.edu
+@Desc    :   Model Based Intelligent Agent (MBIA) supply chain project
+
+"""
+
+import sys
+import time
+from Distributed.initialization import network
+from Distributed.agent import agent
+from Distributed.knowledgebase import communication_manager, message_trace
+
+
+# Number of messages and payload size of each case, round, message type and sender of a trace
+def summarize_trace(records):
+    summary = {}
+    for record in records:
+        if record["type"] not in message_trace.MESSAGE_TYPES:
+            continue
+        for key in [("case", record["case"]), ("round", record["case"], record["round"]),
+                    ("type", record["type"]), ("sender", record["sender"])]:
+            if key not in summary:
+                summary[key] = {"messages": 0, "size": 0}
+            summary[key]["messages"] += 1
+            summary[key]["size"] += record["size"]
+    return summary
+
+
+# Determine the response of a supplier agent again from the inputs recorded by response_optimizer
+def replay_response(ag, payload, solver=None):
+    product_set = {}
+    demands = {}
+    for j, k, amount in payload["demands"]:
+        try:
+            product_set[j].append(k)
+        except:
+            product_set[j] = [k]
+        demands[(j, k)] = amount
+    demand_agents = payload["flow_limit"].keys()
+    pairs = [(j, k) for j in demand_agents for k in product_set[j]]
+    if (solver or payload["solver"]) == "greedy":
+        xsol = ag.greedy_response(demand_agents, product_set, demands, payload["flow_limit"],
+                                  payload["production_limit"])
+    else:
+        xsol = ag.solve_response(pairs, demand_agents, product_set, demands, payload["flow_limit"],
+                                 payload["production_limit"])
+    return [[j, k, xsol[j, k]] for j, k in pairs]
+
+
+# Select the suppliers of a demand agent again from the demand and the responses recorded by supplier_selector
+def replay_selection(ag, payload, get_agent):
+    ag.demand = dict(payload["demand"])
+    ag.communication_manager.clear_message()
+    for sup_name, offers in payload["responses"].items():
+        ag.communication_manager.inbox.append(communication_manager.Response(get_agent(sup_name), ag, offers))
+    selection_decision, new_flows = ag.supplier_selector()
+    ag.communication_manager.clear_message()
+    return selection_decision
+
+
+def same_result(recorded, replayed, tol=1e-6):
+    if isinstance(recorded, dict):
+        return recorded.keys() == replayed.keys() and all(same_result(recorded[key], replayed[key], tol)
+                                                          for key in recorded)
+    if isinstance(recorded, list):
+        return len(recorded) == len(replayed) and all(same_result(a, b, tol) for a, b in zip(recorded, replayed))
+    if isinstance(recorded, str):
+        return recorded == replayed
+    return abs(recorded - replayed) <= tol
+
+
+# Re-run the decisions of a trace in the recorded order with the recorded inputs, without the disruption cascade
+# Each recorded agent is replaced by a new agent that keeps its model templates as in the traced run
+# solver: "gurobi" or "greedy" for the responses, the recorded solver if None
+# Return {decision type: {"decisions", "recorded_time", "replay_time", "mismatches"}}
+def replay_trace(filename, solver=None):
+    agents = {}
+
+    def get_agent(name):
+        if name not in agents:
+            agents[name] = agent.Agent(name, "Replay")
+        return agents[name]
+
+    results = {decision: {"decisions": 0, "recorded_time": 0.0, "replay_time": 0.0, "mismatches": 0}
+               for decision in message_trace.DECISION_TYPES}
+    for record in message_trace.load_trace(filename):
+        if record["type"] not in results:
+            continue
+        ag = get_agent(record["sender"])
+        start_time = time.perf_counter()
+        if record["type"] == "response_input":
+            replayed = replay_response(ag, record["payload"], solver)
+        else:
+            replayed = replay_selection(ag, record["payload"], get_agent)
+        result = results[record["type"]]
+        result["replay_time"] += time.perf_counter() - start_time
+        result["recorded_time"] += record["duration"]
+        result["decisions"] += 1
+        if not same_result(record["payload"]["result"], replayed):
+            result["mismatches"] += 1
+            print("Different", record["type"], "of", record["sender"], "in case", record["case"],
+                  "round", record["round"])
+    return results
+
+
+if __name__ == '__main__':
+    # replay a trace written by the disruption sweep, e.g. python trace_replay.py trace.jsonl greedy
+    trace_file = sys.argv[1]
+    solver = sys.argv[2] if len(sys.argv) > 2 else None
+    records = message_trace.load_trace(trace_file)
+    for key, value in summarize_trace(records).items():
+        if key[0] in ["type", "case"]:
+            print(key[0], key[1:], value["messages"], "messages,", value["size"], "bytes")
+    for decision, result in replay_trace(trace_file, solver).items():
+        print(decision, ":", result["decisions"], "decisions,", "recorded %.3f s," % result["recorded_time"],
+              "replayed %.3f s," % result["replay_time"], result["mismatches"], "mismatches")
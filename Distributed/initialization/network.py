@@ -9,23 +9,43 @@
 
 from Distributed.agent import customer_agent, distributor_agent, manufacturing_agent, oem_agent, \
     raw_material_agent, transportation_agent
+from Distributed.knowledgebase import journal
+from Distributed.initialization import setup_cache
 import pandas as pd
 
 
 # Information in the network
 def __init__(self):
     self.agent_list = dict()
+    self.agent_index = dict()
+    self.type_index = dict()
     self.link_list = list()
     self.occurred_communication
     self.product_structure
+    self.response_solver
+    self.negotiation
+    self.snapshot
+    self.snapshot_flow
+    self.snapshot_edge_flow
+    self.changed_agents
+    self.journal
+    self.trace
 
 
 # Agent-based supply chain network initialization
 def initialize_agent_network(self):
     # Read xlsx file to create all the agents and add them to the network
     filename = 'initialization/TASE_Setup.xlsx'
-    info = pd.read_excel(filename, sheet_name=None)
+    info = setup_cache.load_setup(filename)
     self.product_structure = info["ProductStructure"].set_index(['Product'])
+    # solver used by the supplier agents to determine responses, "gurobi" or "greedy"
+    self.response_solver = "gurobi"
+    # negotiation of supplier_reselection, "lockstep" runs the agents one after another in phases, "threaded" runs
+    # the supplier responses of each phase in a thread pool, "async" runs the agents as coroutines of the negotiation
+    # engine with the solver calls in a thread pool
+    self.negotiation = "lockstep"
+    # message trace, see attach_trace
+    self.trace = None
 
     agent_initialization(self, info)
 
@@ -41,20 +61,20 @@ def agent_initialization(self, info):
         "TierSupplier": [],
         "Transportation": []
     }
+    # name -> agent and agent type -> agents, kept in sync by add_agent and remove_agent
+    self.agent_index = {}
+    self.type_index = {}
 
     ag_set = set(info["Agent"]["AgentName"])
     for name in ag_set:
         if "sup" in name:
-            ag = manufacturing_agent.ManufacturingAgent(name)
-            self.agent_list["TierSupplier"].append(ag)
+            add_agent(self, "TierSupplier", manufacturing_agent.ManufacturingAgent(name))
         elif "assy" in name:
-            ag = oem_agent.OEMAgent(name)
-            self.agent_list["Assembly"].append(ag)
+            add_agent(self, "Assembly", oem_agent.OEMAgent(name))
         elif "Customer" in name:
-            ag = customer_agent.CustomerAgent(name)
-            self.agent_list["Customer"].append(ag)
+            add_agent(self, "Customer", customer_agent.CustomerAgent(name))
 
-    self.agent_list["Transportation"].append(transportation_agent.TransportationAgent("Transportation"))
+    add_agent(self, "Transportation", transportation_agent.TransportationAgent("Transportation"))
 
     # Initialize capability model
     build_capability_model(self, info)
@@ -66,79 +86,168 @@ def agent_initialization(self, info):
 # Build the initial environment model for each agent
 # Environment model contains a list of agents that one agent can communicate
 def build_environment_model(self, info):
-    transport_link = info["Link"].set_index(['Source', 'Destination'])
-    product_type = info["Agent"].set_index(['ProductType'])
+    # products that each agent can produce and materials that each agent needs, in the order of the setup file
+    producible = {}
+    needed = {}
+    for ag in self.agent_index.values():
+        producible[ag.name] = set(ag.capability.knowledge["Production"])
+        needed[ag.name] = list(dict.fromkeys(need for product in ag.capability.characteristics["Production"]
+                                             for need in ag.capability.characteristics["Production"][product]["Material"]))
 
     # initialize mapping functions for upstream and downstream environment
-    for link in transport_link.index:
-        source_ag = find_agent_by_name(self, link[0])
-        dest_ag = find_agent_by_name(self, link[1])
+    for source, dest in zip(info["Link"]["Source"].tolist(), info["Link"]["Destination"].tolist()):
+        source_ag = find_agent_by_name(self, source)
+        dest_ag = find_agent_by_name(self, dest)
 
         # customers' environment are based on demand
         if 'Customer' in dest_ag.name:
-            for product in dest_ag.demand.keys():
-                if source_ag.capability.have_capability("Production", product):
-                    source_ag.environment.add_environment('downstream', product, dest_ag)
-                    dest_ag.environment.add_environment('upstream', product, source_ag)
+            products = dest_ag.demand.keys()
         else:
-            for product in dest_ag.capability.characteristics["Production"]:
-                for need in dest_ag.capability.characteristics["Production"][product]["Material"].keys():
-                    if source_ag.capability.have_capability("Production", need):
-                        source_ag.environment.add_environment('downstream', need, dest_ag)
-                        dest_ag.environment.add_environment('upstream', need, source_ag)
+            products = needed[dest_ag.name]
+        for product in products:
+            if product in producible[source_ag.name]:
+                source_ag.environment.add_environment('downstream', product, dest_ag)
+                dest_ag.environment.add_environment('upstream', product, source_ag)
 
     # initialize mapping functions for clustering environment
-    product_set = set(product_type.index)
-    for product in product_set:
-        try:
-            cluster_name = product_type.loc[product, "AgentName"].tolist()
-        except: pass
-        else:
-            agent_cluster = []
-            for name in cluster_name:
-                if "Customer" not in name:
-                    agent_cluster.append(find_agent_by_name(self, name))
-            for ag1 in agent_cluster:
-                for ag2 in agent_cluster:
-                    if ag1.name != ag2.name:
-                        ag1.environment.add_environment('clustering', product, ag2)
-                        ag2.environment.add_environment('clustering', product, ag1)
+    # every agent in a cluster shares the list and the name set of the cluster, the other agents of the cluster are
+    # the ones that are not the agent itself
+    agent_product = info["Agent"]
+    for product, names in agent_product.groupby("ProductType", sort=False)["AgentName"]:
+        cluster_names = {name: None for name in names.tolist() if "Customer" not in name}
+        if len(cluster_names) < 2:
+            continue
+        agent_cluster = [find_agent_by_name(self, name) for name in cluster_names]
+        cluster_names = set(cluster_names)
+        for ag in agent_cluster:
+            ag.environment.set_clustering(product, agent_cluster, cluster_names)
 
 # Build the initial capability model for each agent
 # Capability model contains the functionalities of one agent in the supply chain network and
 # a list of products under each functionality
 def build_capability_model(self, info):
-    agent_product = info["Agent"].set_index(['AgentName', 'ProductType'])
-    transport_link = info["Link"].set_index(['Source', 'Destination'])
-    product_structure = info["ProductStructure"].set_index(['Product', 'Needed'])
+    # the first row of each agent and product is used
+    agent_product = info["Agent"].drop_duplicates(['AgentName', 'ProductType'])
+    transport_link = info["Link"]
+    product_structure = info["ProductStructure"]
+
+    # materials needed by each product
+    materials = {}
+    for product, need, amount in zip(product_structure["Product"].tolist(), product_structure["Needed"].tolist(),
+                                     product_structure["Amount"].tolist()):
+        try:
+            materials[product][need] = amount
+        except:
+            materials[product] = {need: amount}
+
     # initialize production capability
-    for idx in agent_product.index:
-        ag = find_agent_by_name(self, idx[0])
+    for name, product, demand, cost, capacity in zip(agent_product["AgentName"].tolist(),
+                                                     agent_product["ProductType"].tolist(),
+                                                     agent_product["Demand"].tolist(),
+                                                     agent_product["ProductionCost"].tolist(),
+                                                     agent_product["ProductionCapacity"].tolist()):
+        ag = find_agent_by_name(self, name)
         if 'Customer' in ag.name:
-            ag.demand[idx[1]] = agent_product.loc[idx, "Demand"][0]
+            ag.demand[product] = demand
         else:
             prod_char = {}
-            prod_char["Cost"] = agent_product.loc[idx, 'ProductionCost'][0]
-            prod_char["Capacity"] = agent_product.loc[idx, 'ProductionCapacity'][0]
-            prod_char["Material"] = {}
-            for need in product_structure.index:
-                if need[0] == idx[1]:
-                    prod_char["Material"][need[1]] = product_structure.loc[need, "Amount"]
-                
-            ag.capability.add_capability("Production", idx[1], prod_char)
-            ag.capability.add_capability("Inventory", idx[1], {'Cost': 0, 'Capacity': 0})
+            prod_char["Cost"] = cost
+            prod_char["Capacity"] = capacity
+            prod_char["Material"] = dict(materials.get(product, {}))
+
+            ag.capability.add_capability("Production", product, prod_char)
+            ag.capability.add_capability("Inventory", product, {'Cost': 0, 'Capacity': 0})
 
     # initialize transportation capability
     tp = find_agent_by_name(self, "Transportation")
-    for link in transport_link.index:
-        tp.capability.knowledge["Transportation"].append((link[0], link[1]))
-        tp.capability.characteristics["Transportation"][(link[0], link[1])] = \
-            {"Cost": transport_link.loc[link, "TransportCost"],
-             "Capacity": transport_link.loc[link, "TransportCapacity"]}
+    for source, dest, cost, capacity in zip(transport_link["Source"].tolist(), transport_link["Destination"].tolist(),
+                                            transport_link["TransportCost"].tolist(),
+                                            transport_link["TransportCapacity"].tolist()):
+        tp.capability.knowledge["Transportation"].append((source, dest))
+        tp.capability.characteristics["Transportation"][(source, dest)] = {"Cost": cost, "Capacity": capacity}
 
 
-def find_agent_by_name(self, name):
+# Add an agent to the network under the category 'key' and register it in the lookup indices
+def add_agent(self, key, ag):
+    self.agent_list[key].append(ag)
+    self.agent_index[ag.name] = ag
+    try:
+        self.type_index[ag.type].append(ag)
+    except:
+        self.type_index[ag.type] = [ag]
+
+
+# Remove an agent from the network and from the lookup indices
+def remove_agent(self, ag):
     for key in self.agent_list:
-        for ag in self.agent_list[key]:
-            if name == ag.name:
-                return ag
\ No newline at end of file
+        if ag in self.agent_list[key]:
+            self.agent_list[key].remove(ag)
+    self.agent_index.pop(ag.name, None)
+    if ag in self.type_index.get(ag.type, []):
+        self.type_index[ag.type].remove(ag)
+
+
+def find_agent_by_name(self, name):
+    return self.agent_index.get(name)
+
+
+def find_agents_by_type(self, ag_type):
+    return self.type_index.get(ag_type, [])
+
+
+# Capture the state, disruption and demand of all the agents and the flows, the changes afterwards are tracked
+def take_snapshot(self):
+    self.changed_agents = set()
+    self.snapshot = {}
+    for ag in self.agent_index.values():
+        self.snapshot[ag.name] = {"state": ag.state.get_snapshot(), "down": ag.down, "demand": ag.demand.copy()}
+        ag.state.track_changes(self.changed_agents, ag.name)
+    tp = find_agent_by_name(self, "Transportation")
+    self.snapshot_flow = tp.flow.copy()
+    self.snapshot_edge_flow = tp.edge_flow.copy()
+    tp.track_changes(self.changed_agents)
+
+
+# Restore the network to the snapshot, only the agents changed since the snapshot are copied back
+# An agent is changed when its state, disruption or demand changes (Agent.record_change)
+def restore_snapshot(self):
+    tp = find_agent_by_name(self, "Transportation")
+    for name in self.changed_agents:
+        ag = find_agent_by_name(self, name)
+        ag.state.restore_snapshot(self.snapshot[name]["state"])
+        ag.down = self.snapshot[name]["down"]
+        ag.demand.clear()
+        ag.demand.update(self.snapshot[name]["demand"])
+    tp.restore_flows(self.snapshot_flow, self.snapshot_edge_flow)
+    self.changed_agents.clear()
+    self.occurred_communication = 0
+
+
+# Journal the changes of the state of all the agents and the flows so that they can be rolled back
+def attach_journal(self):
+    self.journal = journal.Journal()
+    for ag in self.agent_index.values():
+        ag.state.attach_journal(self.journal, ag.name)
+    find_agent_by_name(self, "Transportation").attach_journal(self.journal)
+
+
+# Open a (nested) checkpoint in the journal
+def checkpoint(self):
+    return self.journal.checkpoint()
+
+
+# Undo the changes since the last checkpoint, the disruption and demand of the agents are journaled with their states
+def rollback(self):
+    self.journal.rollback()
+
+
+# Keep the changes since the last checkpoint
+def commit(self):
+    self.journal.commit()
+
+
+# Trace the messages of all the agents to a message_trace.MessageTrace
+def attach_trace(self, trace):
+    self.trace = trace
+    for ag in self.agent_index.values():
+        ag.communication_manager.trace = trace
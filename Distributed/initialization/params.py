@@ -9,6 +9,7 @@ import matplotlib.colors as colors
 import matplotlib.cm as cm
 import matplotlib.lines as mlines
 import json
+from Distributed.initialization import setup_cache
 
 
 class Params:
@@ -36,7 +37,7 @@ class Params:
         # filename = 'MSOM-06-038-R2 Data Set in Excel Enhanced.xls'
         # filename = 'Conference Case - New.xlsx'
         # filename = 'Summer Case.xlsx'
-        data = pd.read_excel(filename, sheet_name=str(scid).zfill(2) + '_SD', index_col=[0, 1])
+        data = setup_cache.load_sheet(filename, str(scid).zfill(2) + '_SD', index_col=[0, 1])
         stageCost = data['stageCost']
 
         self.info['depth'] = data['relDepth']
@@ -49,7 +50,7 @@ class Params:
         self.info['prodLine'] = data.index.tolist()
         self.due_date = data.loc[pd.notna(data['avgDemand']), 'maxServiceTime']
 
-        self.link = pd.read_excel(filename, sheet_name=str(scid).zfill(2) + '_LL', index_col=[0, 1])
+        self.link = setup_cache.load_sheet(filename, str(scid).zfill(2) + '_LL', index_col=[0, 1])
         # self.E = self.link[['sourceStage', 'destinationStage']].to_records(index=False).tolist()
         self.E = set(self.link.index)
         self.e = {(v, k): stageCost.loc[v, k] for v, k in self.info['prodLine']}
@@ -57,7 +58,7 @@ class Params:
         self.u = {link: self.link.loc[link, 'transportCap'] for link in self.E}
         self.Lmax = {v: data.loc[v, 'maxProdLength'].values[0] for v in self.V}
 
-        conversion = pd.read_excel(filename, sheet_name=str(scid).zfill(2) + '_R', index_col=[0, 1])
+        conversion = setup_cache.load_sheet(filename, str(scid).zfill(2) + '_R', index_col=[0, 1])
         self.r = {pair: conversion.loc[pair] for pair in conversion.index}
         self.info['conversion'] = conversion.reset_index()
 
@@ -276,43 +277,69 @@ class Params:
         self._disabled_V = set()
         self._disabled_E = set()
 
-    def to_json(self):
+    # model data in the format of pyomo create_instance(data={None: data}), sets as lists and params as {index: value}
+    # the disabled vertices and edges are left out unless include_disabled
+    def to_pyomo_data(self, include_disabled=False):
+        V = self.V if include_disabled else self.V - self._disabled_V
+        E = self.E if include_disabled else self.E - self._disabled_E
+        data = {
+            'V': {None: [v for v in V]},
+            'K': {None: [k for k in self.K]},
+            'E': {None: [(i, j) for i, j in E]},
+            # 'u': {(i, j): 1e6 for i, j in E},
+            'u': {(i, j): float(self.u[i, j]) for i, j in E},
+            'f': {(i, j): 1e-2 for i, j in E},
+            # 'c': {(i, j, k): float(self.sample_cost((i, j))) for i, j in E for k in self.K},
+            'c': {(i, j, k): float(self.c[i, j]) for i, j in E for k in self.K},
+            'phi': {v: 1e-2 for v in V},
+            'p': {(v, k): 1 if (v, k) in self.info['prodLine'] else 0 for v in V for k in self.K},
+            # 'Lmax': {v: 1e6 if self.info['V_type'][v] in self.stageTypes else 0 for v in V},
+            'Lmax': {v: int(self.Lmax[v]) for v in V},
+            'e': {(v, k): self.get('e', (v, k)) for v in V for k in self.K},
+            'r': {(k1, k2): float(self.get('r', (k1, k2))) for k1 in self.K for k2 in self.K},
+            'd': {(v, k): -self.d[v, k] for v in V for k in self.K},
+            'h': {(v, k): 1 for v in V for k in self.K},
+            'I_0': {(v, k): 0 for v in V for k in self.K},
+            'I_s': {(v, k): 0 for v in V for k in self.K},
+            'rho_d': {(v, k): 1e8 for v in V for k in self.K},
+            'rho_I': {(v, k): 1e8 for v in V for k in self.K}
+        }
+        return data
+
+    # existing network of the network change model, same format as to_pyomo_data
+    def network_data(self, network, penalty, added_edges=0, include_disabled=False):
+        V = self.V if include_disabled else self.V - self._disabled_V
+        E = self.E if include_disabled else self.E - self._disabled_E
         data = {
-            'V': [v for v in self.V - self._disabled_V],
-            'K': [k for k in self.K],
-            'E': [[i, j] for i, j in self.E - self._disabled_E],
-            # 'u': [{'index': [i, j], 'value': 1e6} for i, j in self.E - self._disabled_E],
-            'u': [{'index': [i, j], 'value': float(self.u[i, j])} for i, j in self.E - self._disabled_E],
-            'f': [{'index': [i, j], 'value': 1e-2} for i, j in self.E - self._disabled_E],
-            # 'c': [{'index': [i, j, k], 'value': float(self.sample_cost((i, j)))} for i, j in self.E for k in self.K],
-            'c': [{'index': [i, j, k], 'value': float(self.c[i, j])} for i, j in self.E - self._disabled_E for k in self.K],
-            'phi': [{'index': v, 'value': 1e-2} for v in self.V - self._disabled_V],
-            'p': [{'index': [v, k], 'value': 1 if (v, k) in self.info['prodLine'] else 0} for v in self.V - self._disabled_V for k in
-                  self.K],
-            # 'Lmax': [{'index': v, 'value': 1e6 if self.info['V_type'][v] in self.stageTypes else 0} for v in self.V - self._disabled_V],
-            'Lmax': [{'index': v, 'value': int(self.Lmax[v])} for v in self.V - self._disabled_V],
-            'e': [{'index': [v, k], 'value': self.get('e', (v, k))} for v in self.V - self._disabled_V for k in self.K],
-            'r': [{'index': [k1, k2], 'value': float(self.get('r', (k1, k2)))} for k1 in self.K for k2 in self.K],
-            'd': [{'index': [v, k], 'value': -self.d[v, k]} for v in self.V - self._disabled_V for k in self.K],
-            'h': [{'index': [v, k], 'value': 1} for v in self.V - self._disabled_V for k in self.K],
-            'I_0': [{'index': [v, k], 'value': 0} for v in self.V - self._disabled_V for k in self.K],
-            'I_s': [{'index': [v, k], 'value': 0} for v in self.V - self._disabled_V for k in self.K],
-            'rho_d': [{'index': [v, k], 'value': 1e8} for v in self.V - self._disabled_V for k in self.K],
-            'rho_I': [{'index': [v, k], 'value': 1e8} for v in self.V - self._disabled_V for k in self.K]
+            'exist_z': {(i, j): int(network['z'][i, j]) for i, j in E},
+            'exist_zeta': {i: int(network['zeta'][i]) for i in V},
+            'Rho': {None: penalty},
+            'Emax': {None: added_edges}
         }
+        return data
+
+    def to_json(self):
         with open('data.json', 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+            json.dump(to_portal_format(self.to_pyomo_data()), f, ensure_ascii=False, indent=4)
         # print(data_json)
 
     def network_to_json(self, network, penalty, added_edges=0):
-        data = {
-            'exist_z': [{'index': [i, j], 'value': int(network['z'][i, j])} for i, j in self.E - self._disabled_E],
-            'exist_zeta': [{'index': i, 'value': int(network['zeta'][i])} for i in self.V - self._disabled_V],
-            'Rho': penalty,
-            'Emax': added_edges
-        }
         with open('network.json', 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+            json.dump(to_portal_format(self.network_data(network, penalty, added_edges)), f, ensure_ascii=False,
+                      indent=4)
+
+
+# convert the data of to_pyomo_data to the json format read by pyo.DataPortal
+def to_portal_format(data):
+    portal_data = {}
+    for name, values in data.items():
+        if None in values:  # set or scalar param
+            portal_data[name] = values[None]
+        else:
+            portal_data[name] = [{'index': list(index) if isinstance(index, tuple) else index, 'value': value}
+                                 for index, value in values.items()]
+    return portal_data
+
 
 def main():
     sys.path.append('../')
@@ -324,71 +351,20 @@ def main():
     # my_params.disable(vertex_list=['Manuf_01'])
 
     # my_params.show_graph()
-    my_params.to_json()
     model = pyomoModel.SinglePeriod()
-    model.create_instance(filenames=['data.json'])
+    model.create_instance_from_params(my_params)
     model.solve(tee=False)
     network = model.get(["z", "zeta"])
 
-    print("Disable Part_04")
-    my_params.enable_all()
-    my_params.disable(vertex_list=['Part_04'])
-    my_params.to_json()
-    my_params.network_to_json(network, penalty=1)
-
-    model_networkChange = pyomoModel.SinglePeriod(exist_G=True)
-    model_networkChange.create_instance(filenames=['data.json', 'network.json'])
-    model_networkChange.solve(tee=False)
-
-    print("Disable Part_06")
-    my_params.enable_all()
-    my_params.disable(vertex_list=['Part_06'])
-    my_params.to_json()
-    my_params.network_to_json(network, penalty=1)
-
-    model_networkChange = pyomoModel.SinglePeriod(exist_G=True)
-    model_networkChange.create_instance(filenames=['data.json', 'network.json'])
-    model_networkChange.solve(tee=False)
-
-    print("Disable Part_03")
-    my_params.enable_all()
-    my_params.disable(vertex_list=['Part_03'])
-    my_params.to_json()
-    my_params.network_to_json(network, penalty=1)
-
-    model_networkChange = pyomoModel.SinglePeriod(exist_G=True)
-    model_networkChange.create_instance(filenames=['data.json', 'network.json'])
-    model_networkChange.solve(tee=False)
-
-    print("Disable Part_08")
-    my_params.enable_all()
-    my_params.disable(vertex_list=['Part_08'])
-    my_params.to_json()
-    my_params.network_to_json(network, penalty=1)
-
-    model_networkChange = pyomoModel.SinglePeriod(exist_G=True)
-    model_networkChange.create_instance(filenames=['data.json', 'network.json'])
-    model_networkChange.solve(tee=False)
-
-    print("Disable Manuf_02")
-    my_params.enable_all()
-    my_params.disable(vertex_list=['Manuf_02'])
-    my_params.to_json()
-    my_params.network_to_json(network, penalty=1)
-
-    model_networkChange = pyomoModel.SinglePeriod(exist_G=True)
-    model_networkChange.create_instance(filenames=['data.json', 'network.json'])
-    model_networkChange.solve(tee=False)
-
-    print("Disable Manuf_01")
-    my_params.enable_all()
-    my_params.disable(vertex_list=['Manuf_01'])
-    my_params.to_json()
-    my_params.network_to_json(network, penalty=1)
-
+    # the network change model is built once, each disruption case disables the lost vertex by bounding its variables
+    # the persistent solver keeps the model loaded in gurobi, only the changed bounds and constraints are sent to it
     model_networkChange = pyomoModel.SinglePeriod(exist_G=True)
-    model_networkChange.create_instance(filenames=['data.json', 'network.json'])
-    model_networkChange.solve(tee=False)
+    model_networkChange.create_instance_from_params(my_params, network=network, penalty=1)
+    for vertex in ['Part_04', 'Part_06', 'Part_03', 'Part_08', 'Manuf_02', 'Manuf_01']:
+        print("Disable " + vertex)
+        model_networkChange.enable_all()
+        model_networkChange.disable(vertex_list=[vertex])
+        model_networkChange.solve(solver='gurobi_persistent', tee=False)
 
     # print("Add Retail_05 demand")
     # my_params.enable_all()
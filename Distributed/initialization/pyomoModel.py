@@ -111,6 +111,38 @@ def create_model():
     return model
 
 
+# variables and constraints indexed by a vertex (and product) and by an edge (and product)
+vertex_components = ['zeta', 'x', 'L', 'I', 'delta_d', 'delta_I', 'delta_V', 'flow_balance', 'prod_capacity',
+                     'demand_penalty', 'inventory_penalty', 'vertexChange_penalty1', 'vertexChange_penalty2']
+edge_components = ['z', 'y', 'delta_E', 'delta_Eplus', 'link_capacity', 'linkChange_penalty_1',
+                   'linkChange_penalty_2', 'linkChange_penalty_3']
+
+
+# a variable is bounded to 0 when disabled, a constraint is deactivated
+# the variables are bounded instead of fixed since a persistent solver compiles the fixed variables of the instance
+# into constants, so that they could not be freed again by update_var
+# the change is also applied to the persistent solver holding the instance if any
+def set_component_active(component, active, persistent_opt=None):
+    if component.ctype is pyo.Var:
+        if active:
+            # the bounds of the domain of the variable apply again
+            component.setlb(None)
+            component.setub(None)
+        else:
+            component.setlb(0)
+            component.setub(0)
+        if persistent_opt is not None:
+            persistent_opt.update_var(component)
+    elif active:
+        component.activate()
+        if persistent_opt is not None:
+            persistent_opt.add_constraint(component)
+    else:
+        component.deactivate()
+        if persistent_opt is not None:
+            persistent_opt.remove_constraint(component)
+
+
 class SinglePeriod:
 
     def __init__(self, exist_G=False, soft=True):
@@ -120,6 +152,9 @@ class SinglePeriod:
         self.solved = False
         self.G = nx.MultiDiGraph()
         self.network_change = False
+        # persistent solver (e.g. gurobi_persistent) holding the instance, updated when vertices are disabled/enabled
+        self.persistent_opt = None
+        self.persistent_solver = None
 
         if exist_G:
             self.model.exist_z = pyo.Param(self.model.E)
@@ -190,6 +225,72 @@ class SinglePeriod:
         for filename in filenames:
             data.load(filename=filename)
         self.instance = self.model.create_instance(data)
+        self.persistent_opt = None
+
+    # build the instance directly from a Params object, without writing and reading the json files
+    # network = {"z": ..., "zeta": ...} of the existing network is needed by the network change model (exist_G)
+    # the instance keeps all the vertices and edges, the ones disabled in params are disabled by bounding variables
+    def create_instance_from_params(self, params, network=None, penalty=0, added_edges=0):
+        data = params.to_pyomo_data(include_disabled=True)
+        if network is not None:
+            data.update(params.network_data(network, penalty, added_edges, include_disabled=True))
+        # Emax is only a component of the hard constrained model
+        data = {name: values for name, values in data.items() if self.model.component(name) is not None}
+        self.instance = self.model.create_instance(data={None: data})
+        self.persistent_opt = None
+        self.disabled_V = set()
+        self.disabled_E = set()
+        self.disable(vertex_list=params._disabled_V, edge_list=params._disabled_E)
+
+    # remove vertices and their edges from the instance, their variables are bounded to 0 and their constraints
+    # deactivated, the same model as leaving them out of the data
+    def disable(self, vertex_list=[], edge_list=[]):
+        vertex_list = set(vertex_list) - self.disabled_V
+        edge_list = set(edge_list)
+        for i, j in self.instance.E:
+            if i in vertex_list or j in vertex_list:
+                edge_list.add((i, j))
+        edge_list -= self.disabled_E
+        self.set_active(vertex_list, edge_list, active=False)
+        self.disabled_V.update(vertex_list)
+        self.disabled_E.update(edge_list)
+
+    def enable(self, vertex_list=[], edge_list=[]):
+        vertex_list = set(vertex_list) & self.disabled_V
+        edge_list = set(edge_list)
+        for i, j in self.disabled_E:
+            if i in vertex_list or j in vertex_list:
+                edge_list.add((i, j))
+        edge_list &= self.disabled_E
+        self.set_active(vertex_list, edge_list, active=True)
+        self.disabled_V -= vertex_list
+        self.disabled_E -= edge_list
+
+    def enable_all(self):
+        self.enable(vertex_list=self.disabled_V, edge_list=self.disabled_E)
+
+    # bound to 0 (or free) the variables and deactivate (or activate) the constraints indexed by the vertices and edges
+    def set_active(self, vertex_list, edge_list, active):
+        for name in vertex_components:
+            component = self.instance.component(name)
+            if component is None:
+                continue
+            for v in vertex_list:
+                if component.dim() == 1:
+                    set_component_active(component[v], active, self.persistent_opt)
+                else:
+                    for k in self.instance.K:
+                        set_component_active(component[v, k], active, self.persistent_opt)
+        for name in edge_components:
+            component = self.instance.component(name)
+            if component is None:
+                continue
+            for i, j in edge_list:
+                if component.dim() == 2:
+                    set_component_active(component[i, j], active, self.persistent_opt)
+                else:
+                    for k in self.instance.K:
+                        set_component_active(component[i, j, k], active, self.persistent_opt)
 
     def get(self, attrs):
         if len(attrs) == 0:
@@ -200,13 +301,38 @@ class SinglePeriod:
                             getattr(self.instance, attr)}
         return output
 
+    # the instance is loaded once into a persistent solver (e.g. gurobi_persistent), the later solves only send the
+    # changes made by disable/enable instead of writing the model to a file for a new solver process
+    def get_persistent_solver(self, solver):
+        if self.persistent_opt is None or self.persistent_solver != solver:
+            self.persistent_opt = pyo.SolverFactory(solver)
+            self.persistent_opt.set_instance(self.instance)
+            self.persistent_solver = solver
+        return self.persistent_opt
+
+    # solve the instance with the persistent solver and again with the non-persistent reference solver
+    # raise a ValueError if both solves do not reach the same objective value, return the objective value otherwise
+    def check_persistent(self, solver='gurobi_persistent', reference='gurobi', tol=1e-6):
+        objective = next(self.instance.component_data_objects(pyo.Objective, active=True))
+        self.get_persistent_solver(solver).solve()
+        persistent_value = pyo.value(objective)
+        pyo.SolverFactory(reference).solve(self.instance)
+        reference_value = pyo.value(objective)
+        if abs(persistent_value - reference_value) > tol * max(1, abs(reference_value)):
+            raise ValueError("%s objective %s differs from %s objective %s" % (solver, persistent_value, reference,
+                                                                             reference_value))
+        return reference_value
+
     def solve(self, solver='gurobi', tee=True):
-        opt = pyo.SolverFactory(solver)
         # opt.options['Presolve'] = 0
         if self.instance is None:
             print("Error: Model has not been instantiated. Call create_instance()")
         else:
-            self.results = opt.solve(self.instance, tee=tee)
+            if solver.endswith('_persistent'):
+                self.results = self.get_persistent_solver(solver).solve(tee=tee)
+            else:
+                opt = pyo.SolverFactory(solver)
+                self.results = opt.solve(self.instance, tee=tee)
             if (self.results.solver.status == SolverStatus.ok) and (
                     self.results.solver.termination_condition == TerminationCondition.optimal):
                 print("The instance is feasible and solved to optimal")
@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+# -*-coding:utf-8 -*-
+"""
+@Author  :   Mingjie Bi
+@Contact :   mingjieb@umich.edu
+@Desc    :   Model Based Intelligent Agent (MBIA) supply chain project
+
+"""
+
+import os
+import io
+import sys
+import pickle
+import hashlib
+import pandas as pd
+
+# workbooks already loaded in this process, cache file -> sheets
+loaded_setups = {}
+
+
+# Cache file of a workbook, keyed by the hash of its content so that an edited workbook is compiled again
+# The pandas version is part of the name since the pickled data frames depend on it
+def get_cache_file(filename, content):
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(filename)), '.cache')
+    return os.path.join(cache_dir, '%s-pandas%s.pkl' % (hashlib.sha256(content).hexdigest(), pd.__version__))
+
+
+# Parse all the sheets of a workbook and store them in the cache
+def compile_setup(filename):
+    with open(filename, 'rb') as f:
+        content = f.read()
+    info = pd.read_excel(io.BytesIO(content), sheet_name=None)
+    cache_file = get_cache_file(filename, content)
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    # write to a temporary file first, the sweep workers may compile the same workbook at the same time
+    temp_file = '%s.%d.tmp' % (cache_file, os.getpid())
+    with open(temp_file, 'wb') as f:
+        pickle.dump(info, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_file, cache_file)
+    loaded_setups[cache_file] = info
+    return info
+
+
+# Read all the sheets of a workbook, same as pd.read_excel(filename, sheet_name=None) but from the cache if present
+# The returned data frames are shared, use load_sheet for a copy that can be modified
+def load_setup(filename):
+    with open(filename, 'rb') as f:
+        content = f.read()
+    cache_file = get_cache_file(filename, content)
+    if cache_file in loaded_setups:
+        return loaded_setups[cache_file]
+    if os.path.exists(cache_file):
+        with open(cache_file, 'rb') as f:
+            loaded_setups[cache_file] = pickle.load(f)
+        return loaded_setups[cache_file]
+    return compile_setup(filename)
+
+
+# Read one sheet of a workbook, same as pd.read_excel(filename, sheet_name=sheet_name, index_col=index_col)
+def load_sheet(filename, sheet_name, index_col=None):
+    data = load_setup(filename)[sheet_name].copy()
+    if index_col is None:
+        return data
+    if isinstance(index_col, int):
+        index_col = [index_col]
+    index_names = [data.columns[i] for i in index_col]
+    # pd.read_excel skips the blank rows and forward fills the blank index cells (merged cells), a level is only
+    # filled in the rows where the levels before it are blank too
+    data = data.dropna(how='all')
+    outer_blank = pd.Series(True, index=data.index)
+    for name in index_names:
+        blank = data[name].isna()
+        data[name] = data[name].where(~(blank & outer_blank), data[name].ffill())
+        outer_blank &= blank
+    data = data.set_index(index_names)
+    # columns without header are not named by pd.read_excel when used as index
+    data.index.names = [None if str(name).startswith('Unnamed') else name for name in data.index.names]
+    return data
+
+
+if __name__ == '__main__':
+    # compile the workbooks given in the command line, e.g. python setup_cache.py TASE_Setup.xlsx
+    for filename in sys.argv[1:]:
+        info = compile_setup(filename)
+        print("Compiled", filename, "with sheets", list(info.keys()))
@@ -7,16 +7,71 @@
 
 """
 
+from collections import deque
+
+
+# Request of a demand agent to a supplier agent, quantities = {product: amount}
+class Request():
+    __slots__ = ("sender", "receiver", "quantities")
+    message_type = "request"
+
+    def __init__(self, sender, receiver, quantities):
+        self.sender = sender
+        self.receiver = receiver
+        self.quantities = quantities
+
+    def payload(self):
+        return self.quantities
+
+
+# Response of a supplier agent to a demand agent
+# offers = {product: {"amount", "cost_pd", "remaining_cap_pd", "cost_tp", "remaining_cap_tp"}}
+class Response():
+    __slots__ = ("sender", "receiver", "offers")
+    message_type = "response"
+
+    def __init__(self, sender, receiver, offers):
+        self.sender = sender
+        self.receiver = receiver
+        self.offers = offers
+
+    def payload(self):
+        return self.offers
+
+
 class CommunicationManager():
 
     def __init__(self):
-        self.delivered_request = {}
-        self.received_request = {}
-        self.delivered_response = {}
-        self.received_response = {}
+        # messages received from and delivered to other agents, in the order they are sent
+        self.inbox = deque()
+        self.outbox = deque()
+        # message trace of the network, None if the messages are not traced
+        self.trace = None
+
+    # deliver a message of the owner agent to the inbox of its receiver
+    def send(self, message):
+        self.outbox.append(message)
+        message.receiver.communication_manager.inbox.append(message)
+        self.record(message.message_type, message.sender.name, message.receiver.name, message.payload())
+
+    # write a record to the message trace if any, for the messages that are not delivered through the inbox
+    # and the inputs of the decisions
+    def record(self, message_type, sender, receiver, payload, duration=0):
+        if self.trace is not None:
+            self.trace.record(message_type, sender, receiver, payload, duration)
+
+    def received_requests(self):
+        return [message for message in self.inbox if type(message) is Request]
+
+    def delivered_requests(self):
+        return [message for message in self.outbox if type(message) is Request]
+
+    def received_responses(self):
+        return [message for message in self.inbox if type(message) is Response]
+
+    def delivered_responses(self):
+        return [message for message in self.outbox if type(message) is Response]
 
     def clear_message(self):
-        self.delivered_request.clear()
-        self.received_request.clear()
-        self.delivered_response.clear()
-        self.received_response.clear()
+        self.inbox.clear()
+        self.outbox.clear()
@@ -14,7 +14,11 @@ class EnvironmentModel():
         self.upstream_agent = {}
         self.downstream_agent = {}
         self.transport_agent = {}
+        # product -> all the agents of the cluster of the product, the agent itself included, the list is shared by
+        # the agents of the cluster
         self.clustering_agent = {}
+        # key -> product -> names of the agents in the environment
+        self.agent_names = {}
         # Read initialization file
 
 
@@ -23,22 +27,29 @@ class EnvironmentModel():
 
     def add_environment(self, key, product, agent):
         if key == 'upstream':
-            if product not in self.upstream_agent.keys():
-                self.upstream_agent[product] = [agent]
-            elif agent not in self.upstream_agent[product]:
-                self.upstream_agent[product].append(agent)
+            self.add_agent(self.upstream_agent, key, product, agent)
 
         if key == 'downstream':
-            if product not in self.downstream_agent.keys():
-                self.downstream_agent[product] = [agent]
-            elif agent not in self.downstream_agent[product]:
-                self.downstream_agent[product].append(agent)
+            self.add_agent(self.downstream_agent, key, product, agent)
 
         if key == 'clustering':
-            if product not in self.clustering_agent.keys():
-                self.clustering_agent[product] = [agent]
-            elif agent not in self.clustering_agent[product]:
-                self.clustering_agent[product].append(agent)
+            self.add_agent(self.clustering_agent, key, product, agent)
+
+    # the names in each environment are kept in sets for the membership check, the lists keep the order
+    def add_agent(self, environment, key, product, agent):
+        names = self.agent_names.setdefault(key, {})
+        if product not in environment.keys():
+            environment[product] = [agent]
+            names[product] = {agent.name}
+        elif agent.name not in names[product]:
+            environment[product].append(agent)
+            names[product].add(agent.name)
+
+    # replace the clustering environment of a product with a cluster, the list of its agents and the set of their
+    # names are not copied so that they are built once for all the agents of the cluster
+    def set_clustering(self, product, cluster, names):
+        self.clustering_agent[product] = cluster
+        self.agent_names.setdefault('clustering', {})[product] = names
 
 
     def remove_environment(self, key, product):
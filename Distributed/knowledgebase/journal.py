@@ -0,0 +1,59 @@
+#!/usr/bin/python3
+# -*-coding:utf-8 -*-
+"""
+@Author  :   Mingjie Bi
+@Contact :   mingjieb@umich.edu
+@Desc    :   Model Based Intelligent Agent (MBIA) supply chain project
+
+"""
+
+# marks a key that did not exist before the change
+MISSING = object()
+
+
+class Journal():
+
+    def __init__(self):
+        # undo log, entry = (owner, object, store, key, old value), store is None for an attribute of the object
+        self.entries = []
+        # position in the undo log of each open checkpoint
+        self.checkpoints = []
+
+    # record the value of obj.store[key] before it changes, nothing is recorded without an open checkpoint
+    def record(self, owner, obj, store, key):
+        if len(self.checkpoints) == 0:
+            return
+        self.entries.append((owner, obj, store, key, getattr(obj, store).get(key, MISSING)))
+
+    # record the value of the attribute obj.attr before it changes, a dict is copied since it is changed in place
+    def record_attr(self, owner, obj, attr):
+        if len(self.checkpoints) == 0:
+            return
+        value = getattr(obj, attr)
+        self.entries.append((owner, obj, None, attr, value.copy() if isinstance(value, dict) else value))
+
+    # open a (nested) checkpoint and return its depth
+    def checkpoint(self):
+        self.checkpoints.append(len(self.entries))
+        return len(self.checkpoints)
+
+    # undo all the changes since the last checkpoint and return the owners of the changes
+    def rollback(self):
+        position = self.checkpoints.pop()
+        owners = set()
+        while len(self.entries) > position:
+            owner, obj, store, key, value = self.entries.pop()
+            owners.add(owner)
+            if store is None:
+                setattr(obj, key, value)
+            elif value is MISSING:
+                getattr(obj, store).pop(key, None)
+            else:
+                getattr(obj, store)[key] = value
+        return owners
+
+    # keep the changes since the last checkpoint, they can still be undone by an outer checkpoint
+    def commit(self):
+        self.checkpoints.pop()
+        if len(self.checkpoints) == 0:
+            self.entries.clear()
@@ -0,0 +1,66 @@
+#!/usr/bin/python3
+# -*-coding:utf-8 -*-
+"""
+@Author  :   Mingjie Bi
+@Contact :   mingjieb@umich.edu
+@Desc    :   Model Based Intelligent Agent (MBIA) supply chain project
+
+"""
+
+import json
+import time
+import threading
+
+# messages counted in occurred_communication
+MESSAGE_TYPES = ["notification", "request", "response", "selection", "cancel_downstream", "cancel_upstream"]
+# inputs and results of the decisions of the agents, used to replay the negotiation (functions/trace_replay.py)
+DECISION_TYPES = ["response_input", "selection_input"]
+
+
+# Append-only trace of the messages of the agents, one JSON record per line:
+# {"case", "round", "sender", "receiver", "type", "size", "time", "duration", "payload"}
+# time: seconds since the trace was opened when the record is written
+# duration: seconds spent by the sender to determine the message, 0 if it is not a decision
+# size: length of the JSON payload
+class MessageTrace():
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, 'a', encoding='utf-8')
+        self.start = time.perf_counter()
+        self.case = None
+        self.round = 0
+        # the decisions of the negotiation engine are recorded from the threads of its pool
+        self.lock = threading.Lock()
+
+    # the following records belong to the disruption case, the rounds are counted from 0 again
+    def start_case(self, case):
+        self.case = case
+        self.round = 0
+
+    def next_round(self):
+        self.round += 1
+
+    def record(self, message_type, sender, receiver, payload, duration=0):
+        # numpy numbers of the agent data are written as floats
+        payload_text = json.dumps(payload, separators=(',', ':'), default=float)
+        line = '{"case":%s,"round":%d,"sender":%s,"receiver":%s,"type":%s,"size":%d,"time":%.6f,"duration":%.6f,' \
+               '"payload":%s}\n' % (json.dumps(self.case), self.round, json.dumps(sender), json.dumps(receiver),
+                                    json.dumps(message_type), len(payload_text), time.perf_counter() - self.start,
+                                    duration, payload_text)
+        with self.lock:
+            self.file.write(line)
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+# read the records of a trace file
+def load_trace(filename):
+    with open(filename, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
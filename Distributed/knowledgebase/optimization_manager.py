@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+# -*-coding:utf-8 -*-
+"""
+@Author  :   Mingjie Bi
+@Contact :   mingjieb@umich.edu
+@Desc    :   Model Based Intelligent Agent (MBIA) supply chain project
+
+"""
+
+import os
+import threading
+import gurobipy as gp
+
+# Gurobi environment shared by all the agents in the current process, one for each thread
+# an environment must not be used by several threads at the same time
+shared_env = {}
+env_lock = threading.Lock()
+
+
+# get the Gurobi environment of the current process and thread, it is created at the first call
+def get_env():
+    key = (os.getpid(), threading.get_ident())
+    if key not in shared_env:
+        with env_lock:
+            # a forked worker must not reuse the environments of its parent
+            for other in [k for k in shared_env if k[0] != key[0]]:
+                shared_env.pop(other)
+            env = gp.Env(empty=True)
+            env.setParam("LogToConsole", 0)
+            env.start()
+            shared_env[key] = env
+    return shared_env[key]
+
+
+class OptimizationManager():
+
+    def __init__(self, max_templates=20):
+        # templates[decision][signature] = {"model": model, ...variables and constraints...}
+        self.templates = {}
+        self.max_templates = max_templates
+
+    # get the model template of a decision with the given structure, None if it has not been built
+    # a template built in another thread is dropped, its environment may be in use by that thread
+    def get_template(self, decision, signature):
+        try:
+            template = self.templates[decision][signature]
+        except:
+            return None
+        if template["env"] is not get_env():
+            self.templates[decision].pop(signature)["model"].dispose()
+            return None
+        return template
+
+    # store a built model so that the later decisions with the same structure only update the data
+    def add_template(self, decision, signature, template):
+        if decision not in self.templates:
+            self.templates[decision] = {}
+        templates = self.templates[decision]
+        if len(templates) >= self.max_templates:
+            # drop the oldest template
+            oldest = next(iter(templates))
+            templates.pop(oldest)["model"].dispose()
+        # the model is built with the environment of the current thread
+        template["env"] = get_env()
+        templates[signature] = template
+        return template
+
+    def clear_template(self):
+        for templates in self.templates.values():
+            for template in templates.values():
+                template["model"].dispose()
+        self.templates.clear()
@@ -14,6 +14,28 @@ class StateModel():
         self.outflow = {}
         self.inventory = {}
         self.production = {}
+        # set of changed agents shared by the network, None when the changes are not tracked
+        self.changed_agents = None
+        # undo log shared by the network, None when the changes are not journaled
+        self.journal = None
+        self.owner = None
+
+    # record the name of the owner in changed_agents whenever the state changes
+    def track_changes(self, changed_agents, owner):
+        self.changed_agents = changed_agents
+        self.owner = owner
+
+    # record the old values in the journal whenever the state changes
+    def attach_journal(self, journal, owner):
+        self.journal = journal
+        self.owner = owner
+
+    # called before self.store[key] changes
+    def mark_changed(self, store, key):
+        if self.changed_agents is not None:
+            self.changed_agents.add(self.owner)
+        if self.journal is not None:
+            self.journal.record(self.owner, self, store, key)
 
     def update_prod_inv(self, key, product, change):
         # if key == "inventory":
@@ -21,6 +43,7 @@ class StateModel():
         #     if amount - 0 < 0.01:
         #         self.inventory.pop(product)
         if key == "production":
+            self.mark_changed("production", product)
             try:
                 self.production[product] += change
             except:
@@ -29,6 +52,7 @@ class StateModel():
                 self.production.pop(product)
 
     def update_flow(self, key, agent, product, change):
+        self.mark_changed(key, (agent, product))
         if key == "inflow":
             try:
                 self.inflow[(agent, product)] += change
@@ -44,9 +68,31 @@ class StateModel():
             if self.outflow[(agent, product)] - 0 < 0.1:
                 self.outflow.pop((agent, product))
 
+    # remove a flow and return its amount
+    def remove_flow(self, key, agent, product):
+        self.mark_changed(key, (agent, product))
+        if key == "inflow":
+            return self.inflow.pop((agent, product))
+        if key == "outflow":
+            return self.outflow.pop((agent, product))
 
     def clear_state(self):
+        for store in ["inflow", "outflow", "inventory", "production"]:
+            for key in getattr(self, store).keys():
+                self.mark_changed(store, key)
         self.inflow.clear()
         self.outflow.clear()
         self.inventory.clear()
         self.production.clear()
+
+    def get_snapshot(self):
+        return {"inflow": self.inflow.copy(),
+                "outflow": self.outflow.copy(),
+                "inventory": self.inventory.copy(),
+                "production": self.production.copy()}
+
+    def restore_snapshot(self, snapshot):
+        self.inflow = snapshot["inflow"].copy()
+        self.outflow = snapshot["outflow"].copy()
+        self.inventory = snapshot["inventory"].copy()
+        self.production = snapshot["production"].copy()
@@ -8,12 +8,11 @@
 """
 
 from functions.assign_initial_plan import assign_initial_flow, re_initilize_network
-from functions.agent_attributes import calculate_attributes
-from functions.disruption_response import disruption_adaptation
 from functions.metrics_output import calculate_metrics, calculate_cost
+from functions.scenario_runner import run_disruption_sweep
 
 from initialization import network
-import time
+import os
 import json
 from colorama import init
 from termcolor import colored
@@ -26,35 +25,33 @@ if __name__ == '__main__':
     agent_network = network.initialize_agent_network(network)
     agent_network.occurred_communication = 0
     initial_file_name = 'initialization/InitialPlans.json'
+    # "greedy" skips the solver for the supplier responses
+    response_solver = "gurobi"
+    # "threaded" determines the supplier responses of a round in parallel threads,
+    # "async" lets the agents negotiate concurrently with the solver calls in a thread pool
+    negotiation = "lockstep"
+    # JSON-lines trace of the agent messages (one file per worker), None to disable, see functions/trace_replay.py
+    trace_file = None
     initial_flows, initial_productions, agent_with_productions = assign_initial_flow(agent_network, initial_file_name)
     initial_flow_cost, initial_production_cost = calculate_cost(agent_network, initial_flows, initial_productions)
 
     satisfied = 0
     unsatisfied = 0
     data_summary = {}
-    for ag_name in agent_with_productions:
-        # # Used for debug
-        # if ag_name == 'plastic_sup_4':
-        #     print('debug')
-        attributes = calculate_attributes(agent_network, ag_name, initial_flows, initial_productions)
-        # Disruption scenario
-        start_time = time.time()
-        found_solution = disruption_adaptation(agent_network, ag_name)
-        end_time = time.time()
-
-        run_time = end_time-start_time
-        results = calculate_metrics(agent_network, initial_flows, initial_productions,
-                                    run_time, initial_flow_cost, initial_production_cost)
+    # Disruption scenarios are spread over the available cores, each worker owns its own network
+    n_workers = os.cpu_count()
+    for ag_name, summary, found_solution in run_disruption_sweep(agent_with_productions, initial_file_name,
+                                                                 processes=n_workers,
+                                                                 response_solver=response_solver,
+                                                                 negotiation=negotiation,
+                                                                 trace_file=trace_file):
         if found_solution:
             print("Satisfied solution is found when losing", ag_name)
             satisfied += 1
         else:
             print("Unsatisfied solution is found when losing", ag_name)
             unsatisfied += 1
-        data_summary[ag_name] = {"attributes": attributes, "results": results}
-
-        # Update the network back to initial plan
-        re_initilize_network(agent_network, initial_file_name)
+        data_summary[ag_name] = summary
 
     with open('results/Distributed_results.json', 'w', encoding='utf-8') as f:
         json.dump(data_summary, f, ensure_ascii=False, indent=4)
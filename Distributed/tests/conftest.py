@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+# -*-coding:utf-8 -*-
+"""
+@Author  :   Mingjie Bi
+@Contact :   mingjieb@umich.edu
+@Desc    :   Model Based Intelligent Agent (MBIA) supply chain project
+
+"""
+
+import os
+import sys
+import pytest
+
+# the modules import each other both as Distributed.<package> and as <package>, and read the setup files relative to
+# the Distributed directory, as when main.py is run from there
+DISTRIBUTED_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in [DISTRIBUTED_DIR, os.path.dirname(DISTRIBUTED_DIR)]:
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+INITIAL_FILE_NAME = 'initialization/InitialPlans.json'
+# losses with cancellations up- and downstream, a lost agent without production and a loss that cannot be recovered
+SCENARIOS = ["steering_sup_2", "wire_sup_1", "plastic_sup_2", "button_sup_1", "wood_sup_2", "fabric_sup_1"]
+
+
+# Build the agent network of TASE_Setup.xlsx with the initial plan and a snapshot, as a worker of the sweep
+def build_network(response_solver="gurobi", negotiation="lockstep"):
+    pytest.importorskip("gurobipy")
+    pytest.importorskip("pandas")
+    from Distributed.functions import scenario_runner
+    cwd = os.getcwd()
+    os.chdir(DISTRIBUTED_DIR)
+    try:
+        scenario_runner.initialize_worker(INITIAL_FILE_NAME, response_solver, negotiation)
+    finally:
+        os.chdir(cwd)
+    return scenario_runner.worker_state["agent_network"]
+
+
+# state, disruption, demand, messages and flows of all the agents, in the order they are stored
+def capture_network(agent_network):
+    captured = {}
+    for ag in agent_network.agent_index.values():
+        captured[ag.name] = {"inflow": list(ag.state.inflow.items()),
+                             "outflow": list(ag.state.outflow.items()),
+                             "inventory": list(ag.state.inventory.items()),
+                             "production": list(ag.state.production.items()),
+                             "down": ag.down,
+                             "demand": list(ag.demand.items()),
+                             "inbox": len(ag.communication_manager.inbox),
+                             "outbox": len(ag.communication_manager.outbox)}
+        if ag.name == "Transportation":
+            captured[ag.name]["flow"] = list(ag.flow.items())
+            captured[ag.name]["edge_flow"] = list(ag.edge_flow.items())
+    return captured
+
+
+# results of the scenarios run one after another on the network of the last build_network, without the running time
+def run_scenarios(names):
+    from Distributed.functions import scenario_runner
+    results = {}
+    for name in names:
+        ag_name, result, found_solution = scenario_runner.run_scenario(name)
+        result["results"].pop("T_e")
+        results[ag_name] = (result, found_solution)
+    return results
+
+
+@pytest.fixture(scope="module")
+def agent_network():
+    return build_network()
@@ -0,0 +1,66 @@
+#!/usr/bin/python3
+# -*-coding:utf-8 -*-
+"""
+@Author  :   Mingjie Bi
+@Contact :   mingjieb@umich.edu
+@Desc    :   Model Based Intelligent Agent (MBIA) supply chain project
+
+"""
+
+import types
+import pytest
+
+pytest.importorskip("gurobipy")
+pytest.importorskip("numpy")
+from Distributed.initialization import network
+from Distributed.agent import agent
+from Distributed.knowledgebase import state_model
+
+
+# agent of cancel_upstream_wave that only records when it reduces its inflows
+class WaveAgent():
+
+    def __init__(self, name, suppliers, visits):
+        self.name = name
+        self.state = state_model.StateModel()
+        for sup_name in suppliers:
+            self.state.inflow[(sup_name, "k")] = 1
+        self.visits = visits
+
+    def reduce_inflow(self, agent_network):
+        self.visits.append(self.name)
+
+
+def wave_network(suppliers):
+    visits = []
+    agent_index = {name: WaveAgent(name, sups, visits) for name, sups in suppliers.items()}
+    return types.SimpleNamespace(agent_index=agent_index), visits
+
+
+def test_wave_visits_an_agent_after_all_its_downstream_agents():
+    # A <- B, A <- C, B <- D, C <- D, D <- E
+    agent_network, visits = wave_network({"A": ["B", "C"], "B": ["D"], "C": ["D"], "D": ["E"], "E": []})
+    agent.cancel_upstream_wave(agent_network, [agent_network.agent_index["A"]])
+    # E has no inflow to reduce
+    assert visits == ["A", "B", "C", "D"]
+
+
+def test_wave_with_several_start_agents():
+    # A <- C, B <- C, C <- D
+    agent_network, visits = wave_network({"A": ["C"], "B": ["C"], "C": ["D"], "D": []})
+    agent.cancel_upstream_wave(agent_network, [agent_network.agent_index["B"], agent_network.agent_index["A"]])
+    assert visits == ["B", "A", "C"]
+
+
+def test_wave_visits_each_agent_of_a_cycle_once():
+    # A <- B, B <- C, C <- B
+    agent_network, visits = wave_network({"A": ["B"], "B": ["C"], "C": ["B"]})
+    agent.cancel_upstream_wave(agent_network, [agent_network.agent_index["A"]])
+    assert visits == ["A", "B", "C"]
+
+
+def test_wave_cycle_through_the_start_agent():
+    # A <- B, B <- A
+    agent_network, visits = wave_network({"A": ["B"], "B": ["A"]})
+    agent.cancel_upstream_wave(agent_network, [agent_network.agent_index["A"]])
+    assert visits == ["A", "B"]
@@ -0,0 +1,73 @@
+#!/usr/bin/python3
+# -*-coding:utf-8 -*-
+"""
+@Author  :   Mingjie Bi
+@Contact :   mingjieb@umich.edu
+@Desc    :   Model Based Intelligent Agent (MBIA) supply chain project
+
+"""
+
+import pytest
+from Distributed.knowledgebase import communication_manager
+
+
+# the messages only need the name and the communication manager of their sender and receiver
+class Endpoint():
+
+    def __init__(self, name):
+        self.name = name
+        self.communication_manager = communication_manager.CommunicationManager()
+
+
+class Trace():
+
+    def __init__(self):
+        self.records = []
+
+    def record(self, message_type, sender, receiver, payload, duration=0):
+        self.records.append((message_type, sender, receiver, payload))
+
+
+def test_messages_are_slotted():
+    a, b = Endpoint("A"), Endpoint("B")
+    request = communication_manager.Request(a, b, {"k": 1})
+    response = communication_manager.Response(b, a, {"k": {"amount": 1}})
+    for message in [request, response]:
+        assert not hasattr(message, "__dict__")
+        with pytest.raises(AttributeError):
+            message.extra = 1
+    assert request.payload() == {"k": 1}
+    assert response.payload() == {"k": {"amount": 1}}
+    assert request.message_type == "request" and response.message_type == "response"
+
+
+def test_send_delivers_to_outbox_and_receiver_inbox_in_order():
+    a, b, c = Endpoint("A"), Endpoint("B"), Endpoint("C")
+    first = communication_manager.Request(a, b, {"k": 1})
+    second = communication_manager.Request(a, c, {"l": 2})
+    a.communication_manager.send(first)
+    a.communication_manager.send(second)
+    b.communication_manager.send(communication_manager.Response(b, a, {"k": {"amount": 1}}))
+    assert a.communication_manager.delivered_requests() == [first, second]
+    assert a.communication_manager.received_requests() == []
+    assert b.communication_manager.received_requests() == [first]
+    assert c.communication_manager.received_requests() == [second]
+    responses = a.communication_manager.received_responses()
+    assert len(responses) == 1 and responses[0].sender is b
+    assert b.communication_manager.delivered_responses() == responses
+
+
+def test_send_writes_the_trace():
+    a, b = Endpoint("A"), Endpoint("B")
+    a.communication_manager.trace = Trace()
+    a.communication_manager.send(communication_manager.Request(a, b, {"k": 1}))
+    assert a.communication_manager.trace.records == [("request", "A", "B", {"k": 1})]
+
+
+def test_clear_message():
+    a, b = Endpoint("A"), Endpoint("B")
+    a.communication_manager.send(communication_manager.Request(a, b, {"k": 1}))
+    a.communication_manager.clear_message()
+    b.communication_manager.clear_message()
+    for cm in [a.communication_manager, b.communication_manager]:
+        assert len(cm.inbox) == 0 and len(cm.outbox) == 0
@@ -0,0 +1,50 @@
+#!/usr/bin/python3
+# -*-coding:utf-8 -*-
+"""
+@Author  :   Mingjie Bi
+@Contact :   mingjieb@umich.edu
+@Desc    :   Model Based Intelligent Agent (MBIA) supply chain project
+
+"""
+
+import random
+import pytest
+
+pytest.importorskip("gurobipy")
+pytest.importorskip("numpy")
+from Distributed.initialization import network
+from Distributed.agent import agent
+
+
+def random_requests(rng):
+    demand_agents = ["dm_%d" % j for j in range(rng.randint(1, 4))]
+    product_set = {j: ["k_%d" % k for k in range(rng.randint(1, 3))] for j in demand_agents}
+    demands = {(j, k): rng.choice([0, rng.randint(1, 60), rng.uniform(0, 60)])
+               for j in demand_agents for k in product_set[j]}
+    flow_limit = {j: rng.choice([0, rng.randint(1, 80), rng.uniform(0, 80)]) for j in demand_agents}
+    production_limit = rng.choice([0, rng.randint(1, 150), rng.uniform(0, 150)])
+    return demand_agents, product_set, demands, flow_limit, production_limit
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_greedy_response_matches_solver_response(seed):
+    rng = random.Random(seed)
+    demand_agents, product_set, demands, flow_limit, production_limit = random_requests(rng)
+    pairs = [(j, k) for j in demand_agents for k in product_set[j]]
+    ag = agent.Agent("supplier", "Test")
+    solver = ag.solve_response(pairs, demand_agents, product_set, demands, flow_limit, production_limit)
+    greedy = ag.greedy_response(demand_agents, product_set, demands, flow_limit, production_limit)
+    # the unmet demand is the same, the responses may split it differently between the requests
+    assert sum(greedy.values()) == pytest.approx(sum(solver[j, k] for j, k in pairs))
+    for j in demand_agents:
+        assert sum(greedy[j, k] for k in product_set[j]) <= flow_limit[j] + 1e-6
+        for k in product_set[j]:
+            assert 0 <= greedy[j, k] <= demands[j, k] + 1e-6
+            assert greedy[j, k] == int(greedy[j, k])
+    assert sum(greedy.values()) <= production_limit + 1e-6
+
+
+def test_greedy_response_rejects_exceeded_limits():
+    ag = agent.Agent("supplier", "Test")
+    with pytest.raises(ValueError):
+        ag.greedy_response(["dm"], {"dm": ["k"]}, {("dm", "k"): 5}, {"dm": 10}, -1)
@@ -0,0 +1,152 @@
+#!/usr/bin/python3
+# -*-coding:utf-8 -*-
+"""
+@Author  :   Mingjie Bi
+@Contact :   mingjieb@umich.edu
+@Desc    :   Model Based Intelligent Agent (MBIA) supply chain project
+
+"""
+
+from conftest import SCENARIOS, build_network, capture_network
+from Distributed.knowledgebase import journal, state_model
+
+
+def make_state(j, owner="A"):
+    state = state_model.StateModel()
+    state.attach_journal(j, owner)
+    return state
+
+
+def test_nothing_recorded_without_checkpoint():
+    j = journal.Journal()
+    state = make_state(j)
+    state.update_prod_inv("production", "k", 5)
+    assert j.entries == []
+
+
+def test_rollback_restores_changed_and_added_keys():
+    j = journal.Journal()
+    state = make_state(j)
+    state.update_flow("inflow", "B", "k", 10)
+    assert j.checkpoint() == 1
+    state.update_flow("inflow", "B", "k", 5)
+    state.update_flow("inflow", "C", "k", 3)
+    state.update_prod_inv("production", "k", 2)
+    assert j.rollback() == {"A"}
+    assert state.inflow == {("B", "k"): 10}
+    assert state.production == {}
+
+
+def test_rollback_restores_removed_keys():
+    j = journal.Journal()
+    state = make_state(j)
+    state.update_prod_inv("production", "k", 5)
+    j.checkpoint()
+    state.update_prod_inv("production", "k", -5)
+    assert state.production == {}
+    j.rollback()
+    assert state.production == {"k": 5}
+
+
+def test_nested_rollback_only_undoes_inner_changes():
+    j = journal.Journal()
+    state = make_state(j)
+    j.checkpoint()
+    state.update_prod_inv("production", "k", 1)
+    assert j.checkpoint() == 2
+    state.update_prod_inv("production", "k", 2)
+    state.update_prod_inv("production", "l", 4)
+    j.rollback()
+    assert state.production == {"k": 1}
+    j.rollback()
+    assert state.production == {}
+    assert j.entries == [] and j.checkpoints == []
+
+
+def test_inner_commit_can_be_undone_by_outer_rollback():
+    j = journal.Journal()
+    state = make_state(j)
+    j.checkpoint()
+    state.update_prod_inv("production", "k", 1)
+    j.checkpoint()
+    state.update_prod_inv("production", "k", 2)
+    j.commit()
+    assert state.production == {"k": 3}
+    assert len(j.entries) == 2
+    j.rollback()
+    assert state.production == {}
+
+
+def test_outer_commit_clears_the_log():
+    j = journal.Journal()
+    state = make_state(j)
+    j.checkpoint()
+    j.checkpoint()
+    state.update_prod_inv("production", "k", 1)
+    j.commit()
+    j.commit()
+    assert j.entries == [] and j.checkpoints == []
+    assert state.production == {"k": 1}
+
+
+def test_rollback_returns_owners_of_all_changes():
+    j = journal.Journal()
+    state_a = make_state(j, "A")
+    state_b = make_state(j, "B")
+    make_state(j, "C")
+    j.checkpoint()
+    state_a.update_prod_inv("production", "k", 1)
+    state_b.update_flow("outflow", "A", "k", 1)
+    assert j.rollback() == {"A", "B"}
+
+
+class Holder():
+
+    def __init__(self):
+        self.down = False
+        self.demand = {"k": 1}
+
+
+def test_record_attr_restores_attribute_and_dict_copy():
+    j = journal.Journal()
+    holder = Holder()
+    j.checkpoint()
+    j.record_attr("H", holder, "down")
+    holder.down = True
+    j.record_attr("H", holder, "demand")
+    holder.demand["k"] = 5
+    holder.demand["l"] = 2
+    j.record_attr("H", holder, "demand")
+    holder.demand = {}
+    assert j.rollback() == {"H"}
+    assert holder.down is False
+    assert holder.demand == {"k": 1}
+
+
+def test_network_nested_rollback_round_trip():
+    from Distributed.initialization import network
+    from Distributed.functions.disruption_response import disruption_adaptation
+    agent_network = build_network()
+    network.attach_journal(agent_network)
+
+    def values(captured):
+        # the journal restores the values, the order of the restored keys may change
+        return {name: {key: dict(value) if isinstance(value, list) else value for key, value in state.items()}
+                for name, state in captured.items()}
+
+    initial = values(capture_network(agent_network))
+    network.checkpoint(agent_network)
+    disruption_adaptation(agent_network, SCENARIOS[0])
+    after_first = values(capture_network(agent_network))
+    network.checkpoint(agent_network)
+    disruption_adaptation(agent_network, SCENARIOS[1])
+    assert values(capture_network(agent_network)) != after_first
+    network.rollback(agent_network)
+    assert values(capture_network(agent_network)) == after_first
+    network.rollback(agent_network)
+    assert values(capture_network(agent_network)) == initial
+
+    network.checkpoint(agent_network)
+    disruption_adaptation(agent_network, SCENARIOS[2])
+    network.commit(agent_network)
+    assert agent_network.journal.entries == []
@@ -0,0 +1,19 @@
+#!/usr/bin/python3
+# -*-coding:utf-8 -*-
+"""
+@Author  :   Mingjie Bi
+@Contact :   mingjieb@umich.edu
+@Desc    :   Model Based Intelligent Agent (MBIA) supply chain project
+
+"""
+
+import pytest
+from conftest import SCENARIOS, build_network, run_scenarios
+
+
+@pytest.mark.parametrize("negotiation", ["threaded", "async"])
+def test_negotiation_modes_match_lockstep(negotiation):
+    build_network(negotiation="lockstep")
+    lockstep = run_scenarios(SCENARIOS)
+    build_network(negotiation=negotiation)
+    assert run_scenarios(SCENARIOS) == lockstep
@@ -0,0 +1,32 @@
+#!/usr/bin/python3
+# -*-coding:utf-8 -*-
+"""
+@Author  :   Mingjie Bi
+@Contact :   mingjieb@umich.edu
+@Desc    :   Model Based Intelligent Agent (MBIA) supply chain project
+
+"""
+
+import pytest
+from conftest import SCENARIOS, capture_network, run_scenarios
+
+pytest.importorskip("gurobipy")
+pytest.importorskip("pandas")
+from Distributed.initialization import network
+from Distributed.functions.disruption_response import disruption_adaptation
+
+
+def test_restore_snapshot_round_trip(agent_network):
+    initial = capture_network(agent_network)
+    for name in SCENARIOS:
+        disruption_adaptation(agent_network, name)
+        assert capture_network(agent_network) != initial
+        network.restore_snapshot(agent_network)
+        assert capture_network(agent_network) == initial
+        assert agent_network.occurred_communication == 0
+
+
+def test_scenario_results_do_not_depend_on_previous_scenarios(agent_network):
+    forward = run_scenarios(SCENARIOS)
+    backward = run_scenarios(SCENARIOS[::-1])
+    assert forward == backward
@@ -1,6 +1,7 @@
 import gurobipy as gp
 import pandas as pd
 import math
+from Distributed.initialization import setup_cache
 
 
 class ParamDict(dict):
@@ -33,10 +34,10 @@ class Params:
         parameter_file = "Parameters/Parameter_ToyCaseStudy3.xlsx"
 
         # product set
-        self.K = list(pd.read_excel(parameter_file, sheet_name = 'd', index_col = 0).columns)
+        self.K = list(setup_cache.load_sheet(parameter_file, 'd', index_col=0).columns)
 
         # vertices
-        self.V = list(pd.read_excel(parameter_file, sheet_name = 'd', index_col = 0).index)
+        self.V = list(setup_cache.load_sheet(parameter_file, 'd', index_col=0).index)
 
         # links, mixed-flow capacity, and fixed link cost
         self.E, self.u, self.f = self.pdDFToMultidict_l(parameter_file, 'uf')
@@ -97,7 +98,7 @@ class Params:
 
     # transfer pd dataframe to dictionary (vertex x product)    
     def pdDFToDict_v_k(self, file, sheet):
-        pdDF = pd.read_excel(file, sheet_name = sheet, index_col = 0)
+        pdDF = setup_cache.load_sheet(file, sheet, index_col=0)
         var_dict = {}
         for v in list(pdDF.index):
             for k in list(pdDF.columns):
@@ -107,7 +108,7 @@ class Params:
 
     # transfer pd dataframe to dictionary (source_vertex x dest_vertex x product)
     def pdDFToDict_l_k(self, file, sheet):
-        pdDF = pd.read_excel(file, sheet_name = sheet, index_col = 0)
+        pdDF = setup_cache.load_sheet(file, sheet, index_col=0)
         var_dict = {}
         for i in range(len(list(pdDF.index))):
             source_vertex = pdDF.index[i]
@@ -120,7 +121,7 @@ class Params:
 
     # transfer pd dataframe to Multidictionary (source_vertex x dest_vertex)
     def pdDFToMultidict_l(self, file, sheet):
-        pdDF = pd.read_excel(file, sheet_name = sheet, index_col = 0)
+        pdDF = setup_cache.load_sheet(file, sheet, index_col=0)
         var_dict = {}
         for i in range(len(list(pdDF.index))):
             source_vertex = pdDF.index[i]
@@ -135,7 +136,7 @@ class Params:
 
     # transfer pd dataframe to dictionary (product x product)
     def pdDFToDict_k_k(self, file, sheet):
-        pdDF = pd.read_excel(file, sheet_name = sheet, index_col = 0)
+        pdDF = setup_cache.load_sheet(file, sheet, index_col=0)
         var_dict = {}
         for k in list(pdDF.index):
             for k1 in list(pdDF.columns):
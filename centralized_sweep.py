@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*-coding:utf-8 -*-
+"""
+@Author  :   Mingjie Bi
+@Contact :   mingjieb@umich.edu
+@Desc    :   Model Based Intelligent Agent (MBIA) supply chain project
+
+"""
+
+import os
+import json
+import time
+import multiprocessing as mp
+from CentralizedModel_juanest import CentralizedSinglePeriod
+
+# Base model owned by the current (worker) process
+worker_state = {}
+
+
+# Build the base model and solve the baseline once for the current process, the cases are warm started from it
+def initialize_worker(params, threads, ratios, unmet_penalty):
+    model = CentralizedSinglePeriod(params=params, time_neutral=False, ratios=ratios, unmet_penalty=unmet_penalty)
+    model.m.Params.Threads = threads
+    model.solve(silent=True)
+    worker_state["model"] = model
+
+
+# Solve the case of losing one agent and return its plan and wall time
+def run_case(ag_name):
+    start_time = time.time()
+    results = worker_state["model"].solve_disruption(vertices=[ag_name])
+    return ag_name, results, time.time() - start_time
+
+
+# Split the cores between the worker processes and the Gurobi threads of each worker
+def thread_budget(n_cases, processes=None, threads=None):
+    n_cores = os.cpu_count()
+    if threads is not None:
+        threads = max(1, threads)
+    if processes is None:
+        processes = min(n_cases, max(1, n_cores // threads)) if threads is not None else min(n_cases, n_cores)
+    processes = max(1, processes)
+    if threads is None:
+        threads = max(1, n_cores // processes)
+    return processes, threads
+
+
+# Solve the single-agent-loss cases in a process pool and write CentralizedResults/<case>.json and runtime.json
+# runtime.json maps each case to its cold-solve time, the wall times of these warm-started solves are written next
+# to them under the "warm_start" key: {case: cold time, ..., "warm_start": {case: warm time}}
+def run_centralized_sweep(params, cases, result_dir='CentralizedResults', processes=None, threads=None,
+                          ratios=[0, 0], unmet_penalty=[1]):
+    processes, threads = thread_budget(len(cases), processes, threads)
+    print("Solving", len(cases), "cases with", processes, "workers x", threads, "threads")
+
+    runtime_file = os.path.join(result_dir, 'runtime.json')
+    runtime = {}
+    if os.path.exists(runtime_file):
+        with open(runtime_file) as f:
+            runtime = json.load(f)
+    warm_runtime = runtime.setdefault('warm_start', {})
+
+    with mp.Pool(processes=processes, initializer=initialize_worker,
+                 initargs=(params, threads, ratios, unmet_penalty)) as pool:
+        for ag_name, results, run_time in pool.imap(run_case, cases, chunksize=1):
+            warm_runtime[ag_name] = run_time
+            if results is None:
+                print("No optimal plan is found when losing", ag_name)
+                continue
+            print("Optimal plan is found when losing", ag_name, "in %.2f s" % run_time)
+            with open(os.path.join(result_dir, '%s.json' % ag_name), 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=4)
+
+    with open(runtime_file, 'w', encoding='utf-8') as f:
+        json.dump(runtime, f, ensure_ascii=False, indent=4)
+    return warm_runtime
+
+
+if __name__ == '__main__':
+    # Model data written by CentralizedModel.Params.to_json
+    with open('data_1new.json') as f:
+        params = json.load(f)
+
+    # Same cases as the distributed sweep: losing each agent with production in the initial plan
+    with open('Distributed/initialization/InitialPlans.json') as f:
+        initial_plan = json.load(f)
+    cases = list(dict.fromkeys(prod['Agent'] for prod in initial_plan['Productions']))
+
+    run_centralized_sweep(params, cases)
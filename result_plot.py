@@ -11,6 +11,8 @@ import statistics
 import matplotlib.pyplot as plt
 import json
 import pandas as pd
+# run from the repository root, the result files and the Distributed package are found from there
+from Distributed.initialization import setup_cache
 
 # Read result files
 with open('Distributed/results/Distributed_results.json') as f:
@@ -21,12 +23,17 @@ with open('CentralizedResults/runtime.json') as f:
     centralized_runtime = json.load(f)
 with open('CentralizedResults/communication.json') as f:
     centralized_communication = json.load(f)
-tier_info = pd.read_excel('Distributed/initialization/TASE_Setup.xlsx', sheet_name='Agent').set_index(['AgentType'])
+tier_info = setup_cache.load_sheet('Distributed/initialization/TASE_Setup.xlsx', 'Agent').set_index(['AgentType'])
 
 # Filling the communication and runtime to centralized_results
 for key in centralized_results:
     centralized_results[key]["results"]["M_e"] = centralized_communication[key]
     centralized_results[key]["results"]["T_e"] = centralized_runtime[key]
+    # running time of the warm-started solve of centralized_sweep.py, if the case was swept
+    if key in centralized_runtime.get("warm_start", {}):
+        centralized_results[key]["results"]["T_e_warm"] = centralized_runtime["warm_start"][key]
+        print(key, "cold solve %.2f s, warm-started solve %.2f s" % (centralized_runtime[key],
+                                                                      centralized_runtime["warm_start"][key]))
 
 # Split tier level
 tier_list_info = list(tier_info.loc["Tier3", "AgentName"].values) + list(